@@ -0,0 +1,78 @@
+"""
+Benchmarks of the simulator and the http endpoints over every model in
+`fixture/models`, they're not part of the test run:
+
+    $ pytest benchmarks --benchmark-autosave --benchmark-group-by=func
+    $ pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:10%
+
+Results are saved under `.benchmarks/`, named after the commit they ran on.
+"""
+
+import json
+import os
+import tempfile
+import pytest
+from pathlib import Path
+
+FIXTURES = sorted((Path(__file__).parent.parent / "fixture" / "models").glob("*.json"))
+
+# a database of just the fixtures, model i + 1 is FIXTURES[i]
+DATABASE = Path(tempfile.mkdtemp()) / "ecm-benchmarks.db"
+os.environ["ECM_DATABASE_URI"] = f"sqlite:///{DATABASE}"
+os.environ["ECM_RESULT_STORE_DIR"] = str(DATABASE.parent / "results")
+os.environ["ECM_METRICS_PATH"] = str(DATABASE.parent / "metrics.db")
+# the benchmarks clear the result cache, never a shared one
+os.environ.pop("ECM_RESULT_CACHE_PATH", None)
+
+from ecm import app as ecm_app  # noqa: E402
+from ecm.models import db, Model  # noqa: E402
+from ecm import schemas  # noqa: E402
+
+with ecm_app.app_context():
+    db.create_all()
+    for filename in FIXTURES:
+        db.session.add(Model(**json.loads(filename.read_text())))
+    db.session.commit()
+
+
+def defaultSimulation(model: schemas.Model, **simulation):
+    """
+    A year of `model` with the default params and initial conditions, plus
+    some of the first susceptible compartment infected so the dynamics
+    aren't flat.
+    """
+    initialConditions = {c.name: c.default for c in model.compartments}
+    susceptible = model.compartments[0].name
+    infected = "I" + susceptible[1:]
+    if infected in initialConditions:
+        initialConditions[susceptible] -= 0.01
+        initialConditions[infected] += 0.01
+    return schemas.Simulation(
+        **{
+            "step": 1,
+            "days": 365,
+            "initial_conditions": initialConditions,
+            "params": {p.name: p.default for p in model.params},
+            **simulation,
+        }
+    )
+
+
+def defaultIterate(model: schemas.Model, intervals):
+    """
+    `intervals` values of the first iterable param around its default.
+    """
+    param = next(p for p in model.params if p.iterable)
+    start, end = (param.default * 0.5, param.default * 1.5) if param.default else (0, 1)
+    return {"key": param.name, "intervals": intervals, "start": start, "end": end}
+
+
+@pytest.fixture(params=range(len(FIXTURES)), ids=[f.stem for f in FIXTURES])
+def model(request):
+    data = json.loads(FIXTURES[request.param].read_text())
+    return schemas.Model(id=request.param + 1, **data)
+
+
+@pytest.fixture
+def app():
+    return ecm_app
@@ -0,0 +1,62 @@
+"""
+Time it takes a fresh interpreter to import `ecm.wsgi:app`, which is what
+every gunicorn worker (or the master with `preload_app`) and every `flask`
+command pays before doing anything. Measured without warming up the models
+(`ECM_WARMUP=0`), what the lazy imports save, and with it, what a worker
+pays before answering at full speed. Runs on a copy of the shipped
+database, upgraded by a first unmeasured boot, so it's left untouched.
+
+    $ python benchmarks/startup.py [runs]
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+SCRIPT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "from ecm.wsgi import app\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def importTime(warmup, directory: Path):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=ROOT,
+        env={
+            **os.environ,
+            "ECM_DATABASE_URI": f"sqlite:///{directory / 'ecm.db'}",
+            "ECM_RESULT_STORE_DIR": str(directory / "results"),
+            "ECM_METRICS_PATH": str(directory / "metrics.db"),
+            "ECM_WARMUP": "1" if warmup else "0",
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.splitlines()[-1])
+
+
+def main(runs=10):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        shutil.copy(ROOT / "ecm" / "ecm-fudepan.db", directory / "ecm.db")
+        importTime(True, directory)
+        for warmup in [False, True]:
+            times = [importTime(warmup, directory) for _ in range(runs)]
+            print(
+                f"import ecm.wsgi (ECM_WARMUP={int(warmup)}): "
+                f"median {statistics.median(times) * 1000:.0f}ms "
+                f"min {min(times) * 1000:.0f}ms over {runs} runs"
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,55 @@
+from ecm.models import db, Simulation
+from ecm.resultcache import resultCache
+from ecm.store import resultStore
+from .conftest import defaultIterate, defaultSimulation
+
+
+def forgetResults():
+    for run in Simulation.query.all():
+        resultStore.delete(run.id)
+    Simulation.query.delete()
+    db.session.commit()
+    resultCache.clear()
+
+
+def test_simulate(benchmark, app, model):
+    data = defaultSimulation(model).dict()
+    with app.test_client() as client, app.app_context():
+        # every round simulates, nothing stored or cached is served
+        response = benchmark.pedantic(
+            client.post,
+            (f"/simulate/{model.id}",),
+            {"json": data},
+            setup=forgetResults,
+            rounds=10,
+            warmup_rounds=1,
+        )
+    assert response.status_code == 200
+
+
+def test_simulate_sweep(benchmark, app, model):
+    data = defaultSimulation(model, iterate=defaultIterate(model, 100)).dict()
+    with app.test_client() as client, app.app_context():
+        response = benchmark.pedantic(
+            client.post,
+            (f"/simulate/{model.id}",),
+            {"json": data},
+            setup=forgetResults,
+            rounds=5,
+            warmup_rounds=1,
+        )
+    assert response.status_code == 200
+
+
+def test_simulate_cached(benchmark, app, model):
+    data = defaultSimulation(model).dict()
+    with app.test_client() as client:
+        client.post(f"/simulate/{model.id}", json=data)
+        response = benchmark(client.post, f"/simulate/{model.id}", json=data)
+    assert response.headers["X-Cache"] == "HIT"
+
+
+def test_list_models(benchmark, app):
+    with app.test_client() as client:
+        response = benchmark(client.get, "/api/models/")
+    assert response.status_code == 200
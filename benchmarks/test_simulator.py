@@ -0,0 +1,54 @@
+import copy
+from pytest import mark
+from ecm.simulator import (
+    CompiledModel,
+    ModelContext,
+    Simulator,
+    computeExtraColumns,
+    modelExtendedLatex,
+)
+from .conftest import defaultIterate, defaultSimulation
+
+
+def test_context_build(benchmark, model):
+    benchmark(ModelContext, model)
+
+
+def test_rhs_compile(benchmark, model):
+    # a new context every round, it caches the unfolded expressions
+    benchmark.pedantic(
+        CompiledModel, setup=lambda: ((ModelContext(model),), {}), rounds=5
+    )
+
+
+def test_solve(benchmark, model):
+    context = ModelContext(model)
+    sim = Simulator(context, CompiledModel(context))
+    benchmark(sim.simulate, defaultSimulation(model))
+
+
+@mark.parametrize("intervals", [10, 100, 1000])
+def test_sweep(benchmark, model, intervals):
+    context = ModelContext(model)
+    sim = Simulator(context, CompiledModel(context))
+    simulation = defaultSimulation(model, iterate=defaultIterate(model, intervals))
+    benchmark.pedantic(sim.simulate, (simulation,), rounds=3)
+
+
+def test_extra_columns(benchmark, model):
+    context = ModelContext(model)
+    compiled = CompiledModel(context)
+    simulation = defaultSimulation(model, iterate=defaultIterate(model, 10))
+    result = Simulator(context, compiled).simulate(simulation)
+
+    def setup():
+        # computeExtraColumns extends the result it's given
+        extended = copy.copy(result)
+        extended.compartments = list(result.compartments)
+        return (context, extended, compiled.observables), {}
+
+    benchmark.pedantic(computeExtraColumns, setup=setup, rounds=20)
+
+
+def test_extended_latex(benchmark, model):
+    benchmark(modelExtendedLatex, model)
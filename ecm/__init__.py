@@ -2,13 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
 import sys
 
 from flask import Flask
 from pathlib import Path
 from .views import bp
-from .models import db
-from .cli import load_data, create_db
+from sqlalchemy.exc import OperationalError
+from .models import db, upgradeSchema
+from .metrics import metrics
+from .resultcache import resultCache
+from .store import resultStore
+from .cli import load_data, create_db, render_latex, run_jobs, upgrade_db
 
 BASE_DIR = Path(".")  # The folder right above this file.
 
@@ -16,12 +21,52 @@ BASE_DIR = Path(".")  # The folder right above this file.
 def create_app():
     app = Flask(__name__, static_url_path="")
     app.register_blueprint(bp)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///ecm-fudepan.db"
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "ECM_DATABASE_URI", "sqlite:///ecm-fudepan.db"
+    )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["BASE_DIR"] = BASE_DIR
+    # "numpy", "python" or "native", see ecm.simulator.native
+    app.config["ODE_BACKEND"] = os.environ.get("ECM_ODE_BACKEND", "numpy")
+    app.config["SWEEP_PROCESSES"] = int(os.environ.get("ECM_SWEEP_PROCESSES", 1))
+    app.config["RESULT_CACHE_SIZE"] = int(
+        os.environ.get("ECM_RESULT_CACHE_SIZE", 64 * 1024 * 1024)
+    )
+    app.config["RESULT_CACHE_PATH"] = os.environ.get("ECM_RESULT_CACHE_PATH")
+    app.config["RESULT_STORE_DIR"] = os.environ.get(
+        "ECM_RESULT_STORE_DIR", Path(app.root_path) / "results"
+    )
+    # bytes of stored results kept on disk, the oldest runs are deleted past
+    # it, 0 for no limit
+    app.config["RESULT_STORE_SIZE"] = int(
+        os.environ.get("ECM_RESULT_STORE_SIZE", 1024 * 1024 * 1024)
+    )
+    # /simulate runs with more frames, and sweep summaries, aren't stored
+    app.config["RESULT_STORE_MAX_FRAMES"] = int(
+        os.environ.get("ECM_RESULT_STORE_MAX_FRAMES", 100)
+    )
+    app.config["JOB_THREADS"] = int(os.environ.get("ECM_JOB_THREADS", 1))
+    app.config["JOB_TIMEOUT"] = float(os.environ.get("ECM_JOB_TIMEOUT", 3600))
+    # compile every model when ecm.wsgi is imported, see ecm.warmup
+    app.config["WARMUP"] = os.environ.get("ECM_WARMUP", "1") == "1"
+    # limits of each /simulate request, see ecm.simulator.Budget, 0 for none
+    app.config["MAX_POINTS"] = int(os.environ.get("ECM_MAX_POINTS", 100000))
+    app.config["MAX_WORK"] = int(os.environ.get("ECM_MAX_WORK", 10000000))
+    app.config["MAX_RHS_CALLS"] = int(os.environ.get("ECM_MAX_RHS_CALLS", 1000000))
+    # under the gunicorn timeout, so the worker isn't killed first
+    app.config["MAX_SECONDS"] = float(os.environ.get("ECM_MAX_SECONDS", 25))
+    # shared by every worker, /metrics reports the samples of all of them
+    app.config["METRICS_PATH"] = os.environ.get(
+        "ECM_METRICS_PATH", Path(app.root_path) / "metrics.db"
+    )
+    # answer requests with ?profile=1 with a cProfile summary, see ecm.views
+    app.config["PROFILE"] = os.environ.get("ECM_PROFILE") == "1"
 
     app.cli.add_command(load_data)
     app.cli.add_command(create_db)
+    app.cli.add_command(render_latex)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(upgrade_db)
 
     # Configure logging.
     app.logger.setLevel(logging.DEBUG)
@@ -36,9 +81,27 @@ def create_app():
 
     app.logger.addHandler(handler)
     db.init_app(app)
+    upgradeDatabase(app)
+    resultCache.init_app(app)
+    resultStore.init_app(app)
+    metrics.init_app(app)
     return app
 
 
+def upgradeDatabase(app):
+    """
+    Adds what a database created by an older version is missing, see
+    `upgradeSchema`, so a deploy never serves from an outdated schema. A
+    database that can't be reached is left for the requests to report.
+    """
+    with app.app_context():
+        try:
+            for name in upgradeSchema():
+                app.logger.info(f"database upgraded added={name}")
+        except OperationalError as e:
+            app.logger.error(f"database upgrade failed error={e}")
+
+
 app = create_app()
 
 __all__ = ["app"]
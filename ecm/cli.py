@@ -7,6 +7,9 @@ import click
 from flask import current_app
 from flask.cli import with_appcontext
 from ecm import db, models
+from ecm.simulator import modelCache
+from ecm.jobs import workLoop
+from ecm.store import resultStore
 
 
 def load_model_fixture(app):
@@ -27,7 +30,13 @@ def load_data():
     app = current_app
 
     if models.Model.query.first():
+        # bulk deletes skip the orm events, drop every compiled model by hand
+        models.ModelLatex.query.delete()
+        # runs of the old models, with their stored frames
+        models.Simulation.query.delete()
+        resultStore.clear()
         models.Model.query.delete()
+        modelCache.clear()
 
     session = db.session
 
@@ -38,6 +47,29 @@ def load_data():
         print(instance.name)
 
 
+@click.command()
+@with_appcontext
+def render_latex():
+    """
+    Renders the latex of every model, for models saved before it was stored.
+    """
+    connection = db.session.connection()
+    for model in models.Model.query.all():
+        models.store_model_latex(connection, model)
+        print(model.name)
+    db.session.commit()
+
+
+@click.command()
+@with_appcontext
+def run_jobs():
+    """
+    Runs submitted simulation jobs until interrupted, start several to get
+    a pool of workers.
+    """
+    workLoop(current_app._get_current_object())
+
+
 @click.command()
 @with_appcontext
 def create_db():
@@ -45,3 +77,14 @@ def create_db():
     Bootstrap command to create the database if doesn't exist.
     """
     db.create_all()
+
+
+@click.command()
+@with_appcontext
+def upgrade_db():
+    """
+    Adds the tables, columns and indexes a database created by an older
+    version is missing, safe to run on an up to date one.
+    """
+    for name in models.upgradeSchema():
+        print(f"added {name}")
@@ -0,0 +1,191 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from threading import Event, Lock, Thread
+from . import schemas
+from .metrics import metrics, timingSamples
+from .models import db, Model, Simulation
+from .simulator import SimulatorError, modelCache
+from .store import (
+    evictSimulations,
+    findPreviousSimulation,
+    findSimulation,
+    RESPONSE_FIELDS,
+    resultStore,
+    simulationColumns,
+)
+from .timing import Timings, startTimings, stopTimings
+
+# seconds an idle worker waits before looking for new jobs
+POLL_INTERVAL = 1.0
+# seconds between progress writes while a job runs
+PROGRESS_INTERVAL = 0.5
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+__wakeup = Event()
+__workers = []
+__workersLock = Lock()
+
+
+def submitJob(model: schemas.Model, simulation: schemas.Simulation):
+    """
+    Queues `simulation`, or returns an earlier run of it when there is one.
+    """
+    stored = findSimulation(model, simulation)
+    if stored is not None:
+        return stored
+    job = Simulation(status=PENDING, **simulationColumns(model, simulation))
+    db.session.add(job)
+    db.session.commit()
+    __wakeup.set()
+    return job
+
+
+def jobStatus(job: Simulation):
+    return {
+        "id": job.id,
+        "model": job.model,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "created": job.created.isoformat(),
+        "started": job.started.isoformat() if job.started else None,
+        "finished": job.finished.isoformat() if job.finished else None,
+    }
+
+
+def claimJob(timeout: float = None):
+    """
+    Marks the oldest pending job as running and returns it, None when there
+    are no pending jobs. Jobs running for more than `timeout` seconds, left
+    behind by a worker that died, are claimed again. Safe with several
+    workers polling the same database, only one of them gets each job.
+    """
+    claimable = Simulation.status == PENDING
+    if timeout:
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        stale = or_(Simulation.started.is_(None), Simulation.started < cutoff)
+        claimable = or_(claimable, and_(Simulation.status == RUNNING, stale))
+    while True:
+        job = Simulation.query.filter(claimable).order_by(Simulation.id).first()
+        if job is None:
+            return None
+        claimed = Simulation.query.filter_by(
+            id=job.id, status=job.status, started=job.started
+        ).update({"status": RUNNING, "started": datetime.utcnow()})
+        db.session.commit()
+        if claimed:
+            return job
+
+
+def __progressWriter(job):
+    lastWrite = 0
+
+    def progress(done, total):
+        nonlocal lastWrite
+        if done < total and time.monotonic() - lastWrite < PROGRESS_INTERVAL:
+            return
+        lastWrite = time.monotonic()
+        job.progress = done / total
+        db.session.commit()
+
+    return progress
+
+
+def jobSimulation(job: Simulation, **response):
+    """
+    The simulation a job runs, plus the `response` fields it's stored without.
+    """
+    stored = schemas.Simulation.from_orm(job).dict(exclude=RESPONSE_FIELDS)
+    return schemas.Simulation(**stored, **response)
+
+
+def runJob(app, job: Simulation):
+    from .simulator import Simulator, computeExtraColumns
+
+    simulation = jobSimulation(job)
+    try:
+        model = schemas.Model.from_orm(Model.query.get(job.model))
+        compiled = modelCache.get(model, app.config["ODE_BACKEND"])
+        sim = Simulator(
+            compiled.context,
+            compiled,
+            app.config["SWEEP_PROCESSES"],
+            __progressWriter(job),
+        )
+        previous = findPreviousSimulation(model, simulation)
+        if previous is not None:
+            result = sim.extend(simulation, resultStore.load(previous.id))
+        else:
+            result = sim.simulate(simulation)
+        computeExtraColumns(compiled.context, result, compiled.observables)
+        job.size = resultStore.save(job.id, result)
+        job.status = DONE
+    except SimulatorError as e:
+        job.status, job.error = FAILED, e.args[1]
+    except Exception as e:
+        app.logger.exception(f"job={job.id} failed")
+        # the session may be left mid transaction by whatever failed
+        db.session.rollback()
+        job.status, job.error = FAILED, str(e)
+    job.finished = datetime.utcnow()
+    db.session.commit()
+    evictSimulations(keep=job.id)
+
+
+def recordJobMetrics(job: Simulation, timings: Timings):
+    labels = {"endpoint": "job", "model": job.model}
+    counters, observations = timingSamples(timings, labels)
+    counters.append(("ecm_jobs_total", {"model": job.model, "status": job.status}, 1))
+    metrics.record(counters, observations)
+
+
+def __runNextJob(app):
+    """
+    Claims and runs the oldest pending job, False when there was none.
+    """
+    job = claimJob(app.config["JOB_TIMEOUT"])
+    if job is None:
+        return False
+    app.logger.info(f"job={job.id} model={job.model} status=running")
+    timings = startTimings()
+    runJob(app, job)
+    stopTimings()
+    app.logger.info(f"job={job.id} status={job.status} {timings.logFields()}")
+    recordJobMetrics(job, timings)
+    return True
+
+
+def workLoop(app, stop: Event = None):
+    """
+    Runs pending jobs until `stop` is set, sleeping up to `POLL_INTERVAL`
+    between polls while the queue is empty. An error, e.g. the database
+    going away, is logged and the loop goes on polling.
+    """
+    stop = stop or Event()
+    with app.app_context():
+        while not stop.is_set():
+            __wakeup.clear()
+            try:
+                ran = __runNextJob(app)
+            except Exception:
+                app.logger.exception("job worker error")
+                ran = False
+            if not ran:
+                db.session.remove()
+                __wakeup.wait(POLL_INTERVAL)
+
+
+def startWorkers(app):
+    """
+    Starts `JOB_THREADS` threads running `workLoop` in this process, only
+    once, replacing the ones that ended. They're started on the first
+    submitted job so gunicorn forks the web workers before any thread exists.
+    """
+    with __workersLock:
+        __workers[:] = [thread for thread in __workers if thread.is_alive()]
+        while len(__workers) < app.config["JOB_THREADS"]:
+            thread = Thread(target=workLoop, args=(app,), daemon=True)
+            thread.start()
+            __workers.append(thread)
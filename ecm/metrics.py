@@ -0,0 +1,143 @@
+import sqlite3
+from collections import defaultdict
+from .timing import Timings
+
+SECONDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+BYTES = (10**3, 10**4, 10**5, 10**6, 10**7, 10**8)
+FRAMES = (1, 10, 100, 1000, 10000, 100000)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "ecm_requests_total": ("counter", "Requests by endpoint, model and status", None),
+    "ecm_request_seconds": ("histogram", "Request latency by endpoint", SECONDS),
+    "ecm_stage_seconds": ("histogram", "Time spent in each stage by model", SECONDS),
+    "ecm_response_bytes": ("histogram", "Response size by endpoint", BYTES),
+    "ecm_simulation_frames": ("histogram", "Frames solved per simulation", FRAMES),
+    "ecm_frames_total": ("counter", "Frames solved by model", None),
+    "ecm_rhs_calls_total": ("counter", "Right hand side evaluations by model", None),
+    "ecm_result_cache_hits_total": ("counter", "Result cache memory hits", None),
+    "ecm_result_cache_disk_hits_total": ("counter", "Result cache disk hits", None),
+    "ecm_result_cache_misses_total": ("counter", "Result cache misses", None),
+    "ecm_model_cache_hits_total": ("counter", "Compiled model cache hits", None),
+    "ecm_model_cache_misses_total": ("counter", "Compiled model cache misses", None),
+    "ecm_jobs_total": ("counter", "Finished jobs by model and status", None),
+}
+
+
+# suffixes of the samples of a metric in the order they're written, a
+# counter has a single sample without one
+SUFFIXES = ("", "_bucket", "_sum", "_count")
+
+
+def labelString(labels):
+    return ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+def timingSamples(timings: Timings, labels):
+    """
+    Counters and observations of a request or job timed by `timings`, every
+    one labeled with `labels`.
+    """
+    counters = [
+        (f"ecm_{name}_total", labels, value) for name, value in timings.counts.items()
+    ]
+    observations = [
+        ("ecm_stage_seconds", {**labels, "stage": name}, seconds)
+        for name, seconds in timings.durations.items()
+    ]
+    if "frames" in timings.counts:
+        observations.append(("ecm_simulation_frames", labels, timings.counts["frames"]))
+    return counters, observations
+
+
+class Metrics:
+    """
+    Counters and histograms in a sqlite database, every gunicorn worker and
+    job thread adds to the same samples so /metrics reports all of them in
+    the prometheus text format. Histogram buckets are stored cumulative.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def init_app(self, app):
+        self.path = app.config.get("METRICS_PATH", self.path)
+        with self.__connect() as connection:
+            # readers don't block the workers adding samples
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sample ("
+                "metric TEXT, suffix TEXT, labels TEXT, le TEXT, value REAL, "
+                "PRIMARY KEY (metric, suffix, labels, le))"
+            )
+
+    def record(self, counters=(), observations=()):
+        """
+        Adds each `(name, labels, value)` of `counters` to its counter and
+        each one of `observations` to its histogram, in a single transaction.
+        """
+        rows = [
+            (name, "", labelString(labels), "", value)
+            for name, labels, value in counters
+        ]
+        for name, labels, value in observations:
+            key = labelString(labels)
+            # every bucket is written, even unchanged, so none is ever missing
+            rows += [
+                (name, "_bucket", key, str(le), int(value <= float(le)))
+                for le in [*METRICS[name][2], "+Inf"]
+            ]
+            rows += [(name, "_sum", key, "", value), (name, "_count", key, "", 1)]
+        with self.__connect() as connection:
+            connection.executemany(
+                "INSERT INTO sample VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (metric, suffix, labels, le) "
+                "DO UPDATE SET value = value + excluded.value",
+                rows,
+            )
+
+    def render(self):
+        """
+        Every sample in the prometheus text exposition format.
+        """
+        with self.__connect() as connection:
+            rows = connection.execute("SELECT * FROM sample").fetchall()
+        samples = defaultdict(list)
+        for metric, *sample in rows:
+            samples[metric].append(sample)
+
+        lines = []
+        for metric in sorted(samples):
+            kind, description, _ = METRICS.get(metric, ("counter", "", None))
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+            for suffix, labels, le, value in sorted(samples[metric], key=sampleOrder):
+                if le:
+                    labels = ",".join(filter(None, [labels, f'le="{le}"']))
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"{metric}{suffix}{labels} {sampleValue(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.__connect() as connection:
+            connection.execute("DELETE FROM sample")
+
+    def __connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        # losing the last samples on a power failure is fine, an fsync per
+        # request isn't
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+
+def sampleValue(value):
+    # every digit, a large counter must still show small increments
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def sampleOrder(sample):
+    # each label set's buckets by bound, then its sum and count
+    suffix, labels, le, _ = sample
+    return labels, SUFFIXES.index(suffix), float(le or 0)
+
+
+metrics = Metrics()
@@ -1,4 +1,8 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+import sqlalchemy
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
 
 db = SQLAlchemy()
 
@@ -19,7 +23,62 @@ class Model(db.Model):
         return "<Model %r>" % (self.name)
 
 
+class ModelLatex(db.Model):
+    """
+    Output of `modelExtendedLatex` for a model, rendered whenever the model
+    is saved so /api/models/ doesn't have to.
+    """
+
+    __tablename__ = "model_latex"
+    model = db.Column(db.ForeignKey("model.id"), primary_key=True)
+    latex = db.Column(db.JSON)
+
+    def __repr__(self):
+        return "<ModelLatex %r>" % (self.model)
+
+
+def store_model_latex(connection, model):
+    from . import schemas
+    from .simulator import SimulatorError, modelExtendedLatex
+
+    table = ModelLatex.__table__
+    connection.execute(table.delete().where(table.c.model == model.id))
+    try:
+        latex = modelExtendedLatex(schemas.Model.from_orm(model))
+    except SimulatorError:
+        # left for /api/models/ to render, and fail, on request
+        return
+    connection.execute(table.insert().values(model=model.id, latex=latex))
+
+
+@event.listens_for(Model, "after_insert")
+def render_model_latex(mapper, connection, target):
+    store_model_latex(connection, target)
+
+
+@event.listens_for(Model, "after_update")
+def invalidate_compiled_model(mapper, connection, target):
+    from .simulator import modelCache
+
+    modelCache.invalidate(target.id)
+    store_model_latex(connection, target)
+
+
+@event.listens_for(Model, "after_delete")
+def delete_compiled_model(mapper, connection, target):
+    from .simulator import modelCache
+
+    modelCache.invalidate(target.id)
+    table = ModelLatex.__table__
+    connection.execute(table.delete().where(table.c.model == target.id))
+
+
 class Simulation(db.Model):
+    """
+    A simulation run by /simulate or submitted to /api/jobs, the table doubles
+    as the job queue the workers in `ecm.jobs` poll.
+    """
+
     __tablename__ = "simulation"
     id = db.Column(db.Integer, primary_key=True)
     model = db.Column(db.ForeignKey("model.id"))
@@ -28,6 +87,93 @@ class Simulation(db.Model):
     initial_conditions = db.Column(db.JSON)
     params = db.Column(db.JSON)
     iterate = db.Column(db.JSON)
+    solver = db.Column(db.JSON)
+    status = db.Column(db.String(), default="pending", index=True)
+    progress = db.Column(db.Float, default=0)
+    error = db.Column(db.String())
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    # when a worker claimed it, running jobs claimed too long ago are run again
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    # finished runs are looked up by these, their frames are in `ecm.store`
+    model_hash = db.Column(db.String())
+    simulation_hash = db.Column(db.String())
+    # same as simulation_hash leaving out the days, to find shorter runs
+    base_hash = db.Column(db.String())
+    # bytes of its stored frames, the store evicts the oldest runs by it
+    size = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index("ix_simulation_hashes", "model_hash", "simulation_hash"),
+        db.Index("ix_simulation_base_hash", "model_hash", "base_hash"),
+    )
 
     def __repr__(self):
-        return "<Simuation %r>" % (self.name)
+        return "<Simuation %r>" % (self.id)
+
+
+def upgradeSchema():
+    """
+    Brings a database created by an older version up to the current models:
+    creates the missing tables, adds the missing columns and indexes. Every
+    column added since the tables were first shipped is nullable or has a
+    python side default, so existing rows only need the new columns empty.
+    Safe to run from several processes starting at once, whatever another
+    one added first is skipped. Returns the `table.column` and index names
+    it added.
+    """
+    engine = db.engine
+    try:
+        db.create_all()
+    except OperationalError:
+        # another process created a table between the check and the create
+        db.create_all()
+    added = []
+    for table in db.metadata.sorted_tables:
+        added += __addColumns(engine, table)
+        added += __addIndexes(engine, table)
+    return added
+
+
+def __addColumns(engine, table):
+    added = []
+    for column in table.columns:
+        if column.name in __columnNames(engine, table):
+            continue
+        kind = column.type.compile(dialect=engine.dialect)
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {kind}'
+                    )
+                )
+        except OperationalError:
+            if column.name not in __columnNames(engine, table):
+                raise
+            continue
+        added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def __addIndexes(engine, table):
+    added = []
+    for index in table.indexes:
+        if index.name in __indexNames(engine, table):
+            continue
+        try:
+            index.create(bind=engine)
+        except OperationalError:
+            if index.name not in __indexNames(engine, table):
+                raise
+            continue
+        added.append(index.name)
+    return added
+
+
+def __columnNames(engine, table):
+    return {c["name"] for c in sqlalchemy.inspect(engine).get_columns(table.name)}
+
+
+def __indexNames(engine, table):
+    return {i["name"] for i in sqlalchemy.inspect(engine).get_indexes(table.name)}
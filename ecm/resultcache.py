@@ -0,0 +1,144 @@
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from . import schemas
+from .simulator import modelHash
+from .store import simulationHash
+from .timing import count
+
+RESULT_CACHE_SIZE = 64 * 1024 * 1024
+RESULT_CACHE_DISK_SIZE = 1024 * 1024 * 1024
+
+
+class ResultCache:
+    """
+    Serialized /simulate responses keyed by the model definition, the
+    normalized simulation and the response format. Entries live in a per
+    process LRU bounded by their total size in bytes and, when a path is
+    configured, in a sqlite database every worker shares.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, path=None, disksize=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.disksize = disksize or RESULT_CACHE_DISK_SIZE
+        self.stats = {"hits": 0, "diskHits": 0, "misses": 0}
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__lock = Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get("RESULT_CACHE_SIZE", self.maxsize)
+        self.path = app.config.get("RESULT_CACHE_PATH", self.path)
+        self.disksize = app.config.get("RESULT_CACHE_DISK_SIZE", self.disksize)
+        if self.path:
+            with self.__connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS result ("
+                    "key TEXT PRIMARY KEY, body BLOB, size INTEGER, accessed REAL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS result_accessed ON result (accessed)"
+                )
+
+    @staticmethod
+    def key(model: schemas.Model, simulation: schemas.Simulation, mimetype):
+        """
+        None for simulations that aren't reproducible, see `simulationHash`.
+        """
+        hash = simulationHash(simulation)
+        if hash is None:
+            return None
+        content = f"{modelHash(model)}\n{hash}\n{mimetype}"
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def get(self, key):
+        with self.__lock:
+            body = self.__entries.get(key)
+            if body is not None:
+                self.__entries.move_to_end(key)
+                self.stats["hits"] += 1
+                count("result_cache_hits")
+                return body
+
+        body = self.__getDisk(key) if self.path else None
+        with self.__lock:
+            if body is None:
+                self.stats["misses"] += 1
+                count("result_cache_misses")
+                return None
+            self.stats["diskHits"] += 1
+            count("result_cache_disk_hits")
+        self.__setMemory(key, body)
+        return body
+
+    def set(self, key, body):
+        self.__setMemory(key, body)
+        if self.path:
+            self.__setDisk(key, body)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+        if self.path:
+            with self.__connect() as connection:
+                connection.execute("DELETE FROM result")
+
+    def report(self):
+        with self.__lock:
+            report = dict(self.stats, entries=len(self.__entries), size=self.__size)
+        lookups = report["hits"] + report["diskHits"] + report["misses"]
+        report["hitRate"] = (
+            (report["hits"] + report["diskHits"]) / lookups if lookups else 0
+        )
+        return report
+
+    def __setMemory(self, key, body):
+        if len(body) > self.maxsize:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__size -= len(self.__entries.pop(key))
+            self.__entries[key] = body
+            self.__size += len(body)
+            while self.__size > self.maxsize:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__size -= len(evicted)
+
+    def __connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def __getDisk(self, key):
+        with self.__connect() as connection:
+            row = connection.execute(
+                "SELECT body FROM result WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE result SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        return bytes(row[0])
+
+    def __setDisk(self, key, body):
+        with self.__connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?)",
+                (key, body, len(body), time.time()),
+            )
+            # evict least recently used entries until the total fits
+            connection.execute(
+                "DELETE FROM result WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total"
+                "  FROM result"
+                " ) WHERE total > ?"
+                ")",
+                (self.disksize,),
+            )
+
+
+resultCache = ResultCache()
@@ -1,6 +1,6 @@
 from .model import Model
-from .simulation import Simulation
+from .simulation import Simulation, Sweep
 from pydantic import ValidationError
 
 
-__all__ = ["Model", "Simulation", "ValidationError"]
+__all__ = ["Model", "Simulation", "Sweep", "ValidationError"]
@@ -1,6 +1,10 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Union
 from pydantic import BaseModel, validator, root_validator
 
+SOLVER_METHODS = ["LSODA", "BDF", "Radau", "RK45"]
+AXIS_SPACES = ["linspace", "logspace", "values"]
+SWEEP_SAMPLERS = ["grid", "lhs"]
+
 
 class Iterate(BaseModel):
     """
@@ -8,14 +12,19 @@ class Iterate(BaseModel):
         "key": "",
         "intervals": 10,
         "start": 0,
-        "end": 1
+        "end": 1,
+        "ensemble": false
     }
+
+    With `ensemble` every value is integrated at once as a single system
+    instead of one solve per value.
     """
 
     key: str
     intervals: int
     start: float
     end: float
+    ensemble: bool = False
 
     @validator("intervals")
     def intervals_positive(cls, intervals):
@@ -23,6 +32,126 @@ class Iterate(BaseModel):
         return intervals
 
 
+class Axis(BaseModel):
+    """
+    {
+        "key": "beta",
+        "space": "linspace",
+        "intervals": 10,
+        "start": 0,
+        "end": 1
+    }
+
+    `logspace` spaces the values geometrically between start and end, with
+    `values` the axis takes the given list as is.
+    """
+
+    key: str
+    space: str = "linspace"
+    intervals: Optional[int]
+    start: Optional[float]
+    end: Optional[float]
+    values: Optional[List[float]]
+
+    @validator("space")
+    def space_supported(cls, space):
+        assert space in AXIS_SPACES, f"space must be one of {AXIS_SPACES}"
+        return space
+
+    @root_validator(skip_on_failure=True)
+    def check_space_bounds(cls, values):
+        key, space = values.get("key"), values.get("space")
+        if space == "values":
+            assert values.get("values"), f"{key} values can't be empty"
+            return values
+
+        start, end = values.get("start"), values.get("end")
+        assert start is not None and end is not None, f"{key} needs start and end"
+        if space == "logspace":
+            assert start > 0 and end > 0, f"{key} logspace bounds must be positive"
+        return values
+
+
+class Sweep(BaseModel):
+    """
+    {
+        "axes": [
+            {"key": "beta", "intervals": 10, "start": 0, "end": 1},
+            {"key": "gamma", "space": "values", "values": [0.1, 0.2]}
+        ],
+        "sampler": "grid",
+        "quantiles": [0.05, 0.5, 0.95]
+    }
+
+    The `grid` sampler simulates every combination of the axes values, `lhs`
+    draws `samples` points by latin hypercube sampling over the axes ranges.
+    Results are summarized per time point as the mean and `quantiles`.
+    """
+
+    axes: List[Axis]
+    sampler: str = "grid"
+    samples: Optional[int]
+    seed: Optional[int]
+    quantiles: List[float] = [0.05, 0.5, 0.95]
+
+    @validator("axes")
+    def axes_unique(cls, axes):
+        keys = [a.key for a in axes]
+        assert len(keys) > 0, "axes can't be empty"
+        assert len(keys) == len(set(keys)), "axes keys must be unique"
+        return axes
+
+    @validator("sampler")
+    def sampler_supported(cls, sampler):
+        assert sampler in SWEEP_SAMPLERS, f"sampler must be one of {SWEEP_SAMPLERS}"
+        return sampler
+
+    @validator("quantiles")
+    def quantiles_in_range(cls, quantiles):
+        for q in quantiles:
+            assert 0 <= q <= 1, "quantiles must be between 0 and 1"
+        return quantiles
+
+    @root_validator(skip_on_failure=True)
+    def check_sampler_axes(cls, values):
+        axes, sampler = values.get("axes"), values.get("sampler")
+        if sampler == "grid":
+            for axis in axes:
+                assert (
+                    axis.space == "values" or axis.intervals and axis.intervals > 0
+                ), f"{axis.key} intervals must be greather than zero"
+        else:
+            samples = values.get("samples")
+            assert samples and samples > 0, "samples must be greather than zero"
+            for axis in axes:
+                assert axis.space != "values", f"lhs can't sample {axis.key} values"
+        return values
+
+
+class Solver(BaseModel):
+    """
+    {
+        "method": "BDF",
+        "rtol": 1e-3,
+        "atol": 1e-6
+    }
+    """
+
+    method: str = "LSODA"
+    rtol: Optional[float]
+    atol: Optional[float]
+
+    @validator("method")
+    def method_supported(cls, method):
+        assert method in SOLVER_METHODS, f"method must be one of {SOLVER_METHODS}"
+        return method
+
+    @validator("rtol", "atol")
+    def tolerance_positive(cls, tolerance):
+        assert tolerance is None or tolerance > 0, "tolerances must be positive"
+        return tolerance
+
+
 class Simulation(BaseModel):
     """
     "simulation" : {
@@ -48,15 +177,27 @@ class Simulation(BaseModel):
             "intervals": 10,
             "start": 0,
             "end": 1
-        }
+        },
+        // or a Sweep over several keys
+        "solver": {
+            "method": "BDF",
+            "rtol": 1e-3,
+            "atol": 1e-6
+        },
+        "max_points": 500
     }
+
+    `max_points` only shapes the response, every series is decimated to at
+    most that many points keeping its peaks and valleys.
     """
 
     step: float = 1.0
     days: float = 365.0
     initial_conditions: Dict[str, float]
     params: Dict[str, float]
-    iterate: Optional[Iterate]
+    iterate: Optional[Union[Iterate, Sweep]]
+    solver: Optional[Solver]
+    max_points: Optional[int]
 
     @validator("days")
     def days_gt_1(cls, days):
@@ -68,6 +209,11 @@ class Simulation(BaseModel):
         assert step > 0, "step must be greather than zero"
         return step
 
+    @validator("max_points")
+    def max_points_gt_2(cls, max_points):
+        assert max_points is None or max_points > 2, "max_points must be at least 3"
+        return max_points
+
     @validator("initial_conditions")
     def initial_conditions_gte_0(cls, initial_conditions):
         for k, v in initial_conditions.items():
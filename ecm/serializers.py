@@ -0,0 +1,175 @@
+import io
+import json
+import numpy as np
+from . import schemas
+from .simulator.downsample import downsample, lttbIndices
+from .simulator.result import SimulatorError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON = "application/json"
+NPZ = "application/x-npz"
+MSGPACK = "application/msgpack"
+NDJSON = "application/x-ndjson"
+
+# json first, it's what browsers asking for */* get
+MIMETYPES = [JSON, NDJSON, NPZ] + ([MSGPACK] if msgpack else [])
+
+
+def splitFrame(result, frame, timeline=None):
+    """
+    Same shape pandas' `DataFrame.to_dict(orient="split")` gives for a frame
+    with the compartments as index and the timeline as columns.
+    """
+    return {
+        "index": list(result.compartments),
+        "columns": result.timeline if timeline is None else timeline,
+        "data": np.ascontiguousarray(frame.T),
+    }
+
+
+def resultResponse(result, simulation: schemas.Simulation):
+    """
+    The /simulate response, numpy arrays are left for the encoders to write.
+    """
+    if simulation.max_points:
+        result = downsample(result, simulation.max_points)
+    if isinstance(simulation.iterate, schemas.Sweep):
+        quantiles = simulation.iterate.quantiles
+        mean, quantileFrames = result.summary(quantiles)
+        return {
+            "type": "summary",
+            "params": {"names": result.param, "values": result.paramValues},
+            "mean": splitFrame(result, mean),
+            "quantiles": [
+                {"quantile": q, "frame": splitFrame(result, frame)}
+                for q, frame in zip(quantiles, quantileFrames)
+            ],
+        }
+    if result.isIterated:
+        return {
+            "type": "multiple",
+            "param": {"name": result.param, "values": np.asarray(result.paramValues)},
+            "frames": [splitFrame(result, frame) for frame in result.frames],
+        }
+    return {"type": "simple", "frame": splitFrame(result, result.frames[0])}
+
+
+def sensitivityResponse(result, simulation: schemas.Simulation):
+    """
+    The /sensitivity response, the simulated frame and a frame per param
+    with the derivative of every compartment with respect to it. With
+    `max_points` the timepoints are picked over every frame at once, so they
+    all still share one timeline.
+    """
+    frames = [result.frames[0], *result.sensitivities.values()]
+    timeline = result.timeline
+    if simulation.max_points:
+        indices = lttbIndices(timeline, np.hstack(frames), simulation.max_points)
+        frames, timeline = [frame[indices] for frame in frames], timeline[indices]
+    return {
+        "type": "sensitivity",
+        "frame": splitFrame(result, frames[0], timeline),
+        "sensitivities": [
+            {"param": param, "frame": splitFrame(result, frame, timeline)}
+            for param, frame in zip(result.sensitivities, frames[1:])
+        ],
+    }
+
+
+def __toList(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def dumpsJson(response):
+    if orjson is not None:
+        return orjson.dumps(
+            response, default=__toList, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(response, default=__toList).encode()
+
+
+def streamResult(result, simulation: schemas.Simulation):
+    """
+    Yields the response as json lines: a first line with the response without
+    its frames, plus `"frames": <count>` when there are several, then each
+    frame on its own line as soon as it's solved. A sweep summary needs every
+    frame, so it's written in a single line. With `max_points` each frame is
+    decimated on its own, with its own timeline. The status was sent with
+    the first line, a simulation failing later, e.g. over its budget, ends
+    the response with an `{"error": ...}` line.
+    """
+    try:
+        yield from __streamLines(result, simulation)
+    except SimulatorError as error:
+        yield dumpsJson({"error": error.args[1]}) + b"\n"
+
+
+def __streamLines(result, simulation: schemas.Simulation):
+    if isinstance(simulation.iterate, schemas.Sweep):
+        yield dumpsJson(resultResponse(result, simulation)) + b"\n"
+        return
+
+    if result.isIterated:
+        header = {
+            "type": "multiple",
+            "param": {"name": result.param, "values": np.asarray(result.paramValues)},
+            "frames": len(result.params),
+        }
+    else:
+        header = {"type": "simple"}
+    yield dumpsJson(header) + b"\n"
+    for frame in result.frames:
+        timeline = result.timeline
+        if simulation.max_points:
+            indices = lttbIndices(timeline, frame, simulation.max_points)
+            frame, timeline = frame[indices], timeline[indices]
+        yield dumpsJson(splitFrame(result, frame, timeline)) + b"\n"
+
+
+def __npzResult(result, simulation: schemas.Simulation):
+    if simulation.max_points:
+        result = downsample(result, simulation.max_points)
+    arrays = {
+        "compartments": np.array(result.compartments),
+        "timeline": result.timeline,
+    }
+    if isinstance(simulation.iterate, schemas.Sweep):
+        quantiles = simulation.iterate.quantiles
+        arrays["mean"], arrays["quantiles"] = result.summary(quantiles)
+        arrays["quantileValues"] = np.array(quantiles)
+        arrays["params"] = np.array(result.param)
+        arrays["paramValues"] = result.paramValues
+    else:
+        arrays["frames"] = np.stack(result.frames)
+        if simulation.iterate:
+            arrays["param"] = np.array(result.param)
+            arrays["paramValues"] = result.paramValues
+    out = io.BytesIO()
+    np.savez(out, **arrays)
+    return out.getvalue()
+
+
+def serializeResult(result, simulation: schemas.Simulation, mimetype=JSON):
+    """
+    Encodes a simulation result as one of `MIMETYPES`. The npz archive holds
+    the frames as a single (frames, time, compartments) array.
+    """
+    if mimetype == NPZ:
+        return __npzResult(result, simulation)
+    response = resultResponse(result, simulation)
+    if mimetype == MSGPACK:
+        return msgpack.packb(response, default=__toList)
+    return dumpsJson(response)
@@ -1,12 +1,26 @@
-from .base import ModelContext, SimulatorError
-from .simulator import Simulator
-from .observables import computeExtraColumns
-from .latex import modelExtendedLatex
-
-__all__ = [
-    "ModelContext",
-    "SimulatorError",
-    "Simulator",
-    "computeExtraColumns",
-    "modelExtendedLatex",
-]
+from importlib import import_module
+
+# names are imported from their module on first use, so importing the
+# package doesn't load sympy and scipy until a model is compiled or solved
+__modules = {
+    "ModelContext": ".base",
+    "SimulatorError": ".result",
+    "BudgetExceeded": ".result",
+    "Budget": ".budget",
+    "SimulationResult": ".result",
+    "CompiledModel": ".compiled",
+    "ModelCache": ".cache",
+    "modelCache": ".cache",
+    "modelHash": ".cache",
+    "Simulator": ".simulator",
+    "computeExtraColumns": ".observables",
+    "modelExtendedLatex": ".latex",
+}
+
+__all__ = list(__modules)
+
+
+def __getattr__(name):
+    if name not in __modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(__modules[name], __name__), name)
@@ -1,51 +1,74 @@
+from functools import cached_property
 from sympy import sympify, Symbol
 from ecm.schemas import Model
+from .result import SimulatorError
+from ecm.timing import stage
 
-RECURSION_DEPTH = 5
 
-
-class SimulatorError(Exception):
-    pass
-
-
-class SimulationResult:
-    def __init__(
-        self, compartments, timeline, frames=None, param=None, paramValues=None
-    ):
-        self.compartments = compartments
-        self.timeline = timeline
-        self.frames = frames is not None or []
-        self.param = param is not None or []
-        self.paramValues = paramValues is not None or []
-
-    @property
-    def isIterated(self):
-        return self.param is not None
+def dependencyOrder(dependencies):
+    """
+    The names in `dependencies` sorted so each one comes after every name it
+    depends on. Raises a SimulatorError with the names forming a cycle when
+    there is one.
+    """
+    order, visited = [], {}
+    for root in dependencies:
+        if root in visited:
+            continue
+        visited[root] = False
+        stack = [(root, iter(dependencies[root]))]
+        while stack:
+            name, pending = stack[-1]
+            for dependency in pending:
+                if visited.get(dependency) is False:
+                    path = [n for n, _ in stack]
+                    start = path.index(dependency)
+                    cycle = path[start:] + [dependency]
+                    raise SimulatorError(
+                        "context", f"Cyclic expressions: {' -> '.join(cycle)}"
+                    )
+                if dependency not in visited:
+                    visited[dependency] = False
+                    stack.append((dependency, iter(dependencies[dependency])))
+                    break
+            else:
+                stack.pop()
+                visited[name] = True
+                order.append(name)
+    return order
 
 
 class ModelContext:
     @staticmethod
-    def unfoldExpression(expressions):
-        expressionSymbols = {Symbol(e) for e in expressions.keys()}
-        notReduced = {
-            e: v
-            for e, v in expressions.items()
-            if len(v.free_symbols.intersection(expressionSymbols)) > 0
+    def unfoldExpressions(expressions):
+        """
+        Copy of `expressions` where no expression refers to another, each
+        one is substituted once, after the ones it depends on.
+        """
+        symbols = {Symbol(name): name for name in expressions}
+        position = {name: idx for idx, name in enumerate(expressions)}
+        # sorted as declared, so the same cycle is always reported
+        dependencies = {
+            name: sorted(
+                (symbols[s] for s in expr.free_symbols if s in symbols),
+                key=position.get,
+            )
+            for name, expr in expressions.items()
         }
-        steps = RECURSION_DEPTH
-        while len(notReduced) > 0 and steps >= 0:
-            for e in notReduced:
-                expressions[e] = expressions[e].subs(expressions)
-            notReduced = {
-                e: v
-                for e, v in notReduced.items()
-                if len(expressions[e].free_symbols.intersection(expressionSymbols)) > 0
-            }
-            steps -= 1
-        if len(notReduced) > 0:
-            raise SimulatorError(
-                "context", "Deep recursion exceeded unfolding expressions."
+        unfolded = {}
+        for name in dependencyOrder(dependencies):
+            unfolded[name] = expressions[name].xreplace(
+                {Symbol(d): unfolded[d] for d in dependencies[name]}
             )
+        return {name: unfolded[name] for name in expressions}
+
+    @cached_property
+    def unfoldedExpressions(self):
+        """
+        `expressions` unfolded, computed the first time it's needed.
+        """
+        with stage("unfold"):
+            return ModelContext.unfoldExpressions(self.expressions)
 
     def __init__(self, model: Model):
         self.params = {p.name: Symbol(p.name) for p in model.params}
@@ -86,6 +109,7 @@ class ModelContext:
             self.odeVariables = self.odeVariables.union(funcExpr.free_symbols)
             self.formulas[reaction.sfrom] -= funcExpr
             self.formulas[reaction.sto] += funcExpr
+        # sorted by name, generated code and its cache keys follow this order
         self.odeVariables = tuple(
-            self.odeVariables.difference(set(self.compartments.values()))
+            sorted(self.odeVariables.difference(self.compartments.values()), key=str)
         )
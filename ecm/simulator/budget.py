@@ -0,0 +1,101 @@
+import math
+import time
+from ecm.schemas import Simulation, Sweep
+from .result import BudgetExceeded
+
+# right hand side evaluations between checks of the clock and the client
+CHECK_EVERY = 256
+
+LIMITS = {"points": "points per frame", "work": "frames times points"}
+
+
+def sweepSize(sweep: Sweep):
+    if sweep.sampler == "lhs":
+        return sweep.samples
+    return math.prod(
+        len(a.values) if a.space == "values" else a.intervals for a in sweep.axes
+    )
+
+
+class Budget:
+    """
+    Limits on the work of a simulation: output `points` per frame, `work` as
+    frames times points, right hand side evaluations (`rhsCalls`, counted
+    per process) and wall time in `seconds`. A limit that is None or zero
+    isn't enforced. `cancelled` is called now and then while solving, the
+    simulation stops once it returns true.
+    """
+
+    def __init__(
+        self, points=None, work=None, rhsCalls=None, seconds=None, cancelled=None
+    ):
+        self.points = points
+        self.work = work
+        self.rhsCalls = rhsCalls
+        self.seconds = seconds
+        self.cancelled = cancelled
+        self.calls = 0
+        self.deadline = None
+
+    @staticmethod
+    def estimate(simulation: Simulation):
+        points = math.ceil(simulation.days / simulation.step)
+        it = simulation.iterate
+        if isinstance(it, Sweep):
+            frames = sweepSize(it)
+        else:
+            frames = it.intervals if it else 1
+        return {"points": points, "frames": frames, "work": points * frames}
+
+    def start(self, simulation: Simulation):
+        """
+        Rejects `simulation` when its estimate is over the budget, otherwise
+        starts the clock.
+        """
+        estimate = Budget.estimate(simulation)
+        for key, limit in [("points", self.points), ("work", self.work)]:
+            if limit and estimate[key] > limit:
+                raise BudgetExceeded(
+                    f"Simulation too large: {estimate['frames']} frames of "
+                    f"{estimate['points']} points are over the limit of "
+                    f"{limit} {LIMITS[key]}",
+                    estimate,
+                )
+        self.calls = 0
+        # wall clock, comparable across the processes solving a sweep
+        self.deadline = time.time() + self.seconds if self.seconds else None
+
+    def charge(self, calls):
+        self.calls += calls
+        if self.rhsCalls and self.calls > self.rhsCalls:
+            raise BudgetExceeded(
+                f"Solver over the limit of {self.rhsCalls} evaluations"
+            )
+        self.checkpoint()
+
+    def checkpoint(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded(f"Solver over the limit of {self.seconds} seconds")
+        if self.cancelled is not None and self.cancelled():
+            raise BudgetExceeded("Simulation cancelled")
+
+    def watch(self, function):
+        """
+        `function` charging its evaluations to the budget, `CHECK_EVERY` at a
+        time, the right hand side is called too often to do more per call.
+        """
+        pending = CHECK_EVERY
+
+        def watched(*args):
+            nonlocal pending
+            pending -= 1
+            if not pending:
+                pending = CHECK_EVERY
+                self.charge(CHECK_EVERY)
+            return function(*args)
+
+        return watched
+
+    def __getstate__(self):
+        # only the process that got the request can tell if it's cancelled
+        return dict(self.__dict__, cancelled=None)
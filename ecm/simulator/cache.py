@@ -0,0 +1,66 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from ecm.schemas import Model
+from ecm.timing import count, stage
+
+MODEL_CACHE_SIZE = 32
+
+
+def modelHash(model: Model):
+    return hashlib.sha1(model.json(sort_keys=True).encode()).hexdigest()
+
+
+class ModelCache:
+    """
+    Per-process LRU of compiled models, keyed by model id and the hash of its
+    definition so an edited model never gets a stale entry.
+    """
+
+    def __init__(self, maxsize=MODEL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, model: Model, backend="numpy"):
+        """
+        The `CompiledModel` of `model`, compiled on a miss.
+        """
+        # sympy is only loaded once a model is compiled
+        from .base import ModelContext
+        from .compiled import CompiledModel
+
+        key = (model.id, modelHash(model), backend)
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                count("model_cache_hits")
+                return self.__entries[key]
+        count("model_cache_misses")
+
+        # build outside the lock, worst case two requests compile the same model
+        with stage("context"):
+            context = ModelContext(model)
+        with stage("compile"):
+            compiled = CompiledModel(context, backend)
+        with self.__lock:
+            self.__entries[key] = compiled
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, modelId):
+        with self.__lock:
+            for key in [k for k in self.__entries if k[0] == modelId]:
+                del self.__entries[key]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+modelCache = ModelCache()
@@ -0,0 +1,38 @@
+from sympy import cse, numbered_symbols
+from sympy.printing.numpy import NumPyPrinter
+
+
+def symbolNames(symbols):
+    """
+    Names the generated code uses for `symbols`, python keywords get renamed.
+    """
+    printer = NumPyPrinter()
+    return [printer.doprint(s) for s in symbols]
+
+
+def buildNumpyFunction(name, args, statements, buffer, outputs):
+    """
+    Generates `name(*args)`, which runs `statements` and then assigns each
+    `(index, expression, comment)` of `outputs` into its `buffer` argument.
+    Subexpressions shared between outputs are computed once, and since every
+    statement is plain numpy arithmetic the function works the same whether
+    its arguments are numbers or arrays.
+    """
+    printer = NumPyPrinter()
+    replacements, reduced = cse(
+        [expr for _, expr, _ in outputs], symbols=numbered_symbols("_x")
+    )
+
+    body = [f"    {statement}" for statement in statements]
+    for symbol, expr in replacements:
+        body.append(f"    {symbol} = {printer.doprint(expr)}")
+    for (index, _, comment), expr in zip(outputs, reduced):
+        body.append(f"    {buffer}[{index}] = {printer.doprint(expr)} # {comment}")
+    body.append(f"    return {buffer}")
+
+    funcstr = "".join(f"import {m}\n" for m in printer.module_imports)
+    funcstr += f"def {name}({', '.join(args)}):\n"
+    funcstr += "\n".join(body)
+    namespace = {}
+    exec(compile(funcstr, f"<{name}>", "exec"), namespace)
+    return namespace[name]
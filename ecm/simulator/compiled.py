@@ -0,0 +1,181 @@
+import numpy as np
+from functools import cached_property
+from types import FunctionType
+from sympy import Matrix, Symbol
+from sympy.logic.boolalg import Boolean
+from .base import ModelContext
+from .result import SimulatorError
+from .codegen import buildNumpyFunction, symbolNames
+from .native import buildNativeFunctions
+from .observables import buildObservablesFunction
+
+
+def buildOdeModelFunction(context: ModelContext):
+    args = "".join(f"{s}, " for s in context.odeVariables)
+    modelstr = f"def ode_model(z, t, {args}*buffers):\n"
+    modelstr += f"    dz = [0]*{len(context.compartments)}\n"
+    modelstr += f"    {', '.join(context.compartments.keys())} = z\n"
+    for idx, (compartment, formula) in enumerate(context.formulas.items()):
+        modelstr += f"    dz[{idx}] = {formula} # {compartment}\n"
+    modelstr += "    return dz"
+    modelcode = compile(modelstr, "<odeModel>", "exec")
+    return FunctionType(modelcode.co_consts[0], globals(), "ode_model")
+
+
+def __buildNumpyFunction(context: ModelContext, name, buffer, outputs):
+    """
+    `name(z, t, *odeVariables, out, jac)` writing `outputs` into `buffer`.
+    """
+    args = ["z", "t", *symbolNames(context.odeVariables), "out", "jac"]
+    compartments = symbolNames(context.compartments.values())
+    # python floats are cheaper than numpy scalars for a single state
+    unpack = f"{', '.join(compartments)}, = z.tolist() if z.ndim == 1 else z"
+    return buildNumpyFunction(name, args, [unpack], buffer, outputs)
+
+
+def buildNumpyOdeModelFunction(context: ModelContext):
+    outputs = [
+        (idx, formula, compartment)
+        for idx, (compartment, formula) in enumerate(context.formulas.items())
+    ]
+    return __buildNumpyFunction(context, "ode_model", "out", outputs)
+
+
+def buildJacobianFunction(context: ModelContext):
+    """
+    Jacobian of the formulas with respect to the compartments, `jac[i, j]` is
+    d(formula i)/d(compartment j). Entries that are always zero are never
+    written, so the buffer must come zero filled.
+    """
+    jacobian = Matrix(list(context.formulas.values())).jacobian(
+        list(context.compartments.values())
+    )
+    names = list(context.compartments.keys())
+    outputs = [
+        (f"{i}, {j}", jacobian[i, j], f"d{names[i]}/d{names[j]}")
+        for i in range(jacobian.rows)
+        for j in range(jacobian.cols)
+        if jacobian[i, j] != 0
+    ]
+    return __buildNumpyFunction(context, "ode_jacobian", "jac", outputs)
+
+
+def buildValuesFunction(context: ModelContext, name, expressions):
+    """
+    `name(*params, *initialConditions, out)` evaluating `expressions` with
+    numbers, `out[i]` is expression i. Expressions that need any other symbol
+    are left out and their item of `out` is never written.
+    """
+    symbols = [
+        *context.params.values(),
+        *(Symbol(f"{c}_0") for c in context.compartments),
+    ]
+    outputs = [
+        (idx, expr, str(expr))
+        for idx, expr in enumerate(expressions)
+        if expr.free_symbols <= set(symbols)
+    ]
+    return buildNumpyFunction(name, [*symbolNames(symbols), "out"], [], "out", outputs)
+
+
+BACKENDS = {
+    "numpy": buildNumpyOdeModelFunction,
+    "python": buildOdeModelFunction,
+    # compiled with the jacobian by buildNativeFunctions, see ecm.simulator.native
+    "native": buildNumpyOdeModelFunction,
+}
+
+
+class CompiledModel:
+    """
+    Everything a simulation needs from a model that doesn't depend on the
+    simulation itself, so it can be built once and reused between requests.
+    """
+
+    def __init__(self, context: ModelContext, backend="numpy"):
+        if backend not in BACKENDS:
+            raise SimulatorError("context", f"Unknown ode backend {backend}")
+        self.context = context
+        self.backend = backend
+
+        self.expressions = context.unfoldedExpressions
+
+        self.variables = [v.subs(self.expressions) for v in context.odeVariables]
+        self.preconditions = {
+            name: predExpr.subs(self.expressions)
+            for name, predExpr in context.preconditions.items()
+        }
+        known = {
+            *context.params.values(),
+            *(Symbol(f"{c}_0") for c in context.compartments),
+        }
+        # preconditions or variables that can't be solved with numbers alone,
+        # predicates that aren't true or false are left for sympy to report
+        self.unsolvedPreconditions = {
+            name
+            for name, predExpr in self.preconditions.items()
+            if not predExpr.free_symbols <= known or not isinstance(predExpr, Boolean)
+        }
+        self.unsolvedVariables = any(
+            not v.free_symbols <= known for v in self.variables
+        )
+        self.preconditionsFunction = buildValuesFunction(
+            context, "preconditions", list(self.preconditions.values())
+        )
+        self.variablesFunction = buildValuesFunction(
+            context, "variables", self.variables
+        )
+        self.odeModel = BACKENDS[backend](context)
+        self.odeJacobian = buildJacobianFunction(context)
+        # works over arrays of states too, the other backends can't
+        self.vectorOdeModel = self.odeModel
+        if backend == "python":
+            self.vectorOdeModel = buildNumpyOdeModelFunction(context)
+        elif backend == "native":
+            # falls back to the numpy functions when it can't be compiled
+            self.odeModel, self.odeJacobian = buildNativeFunctions(context) or (
+                self.odeModel,
+                self.odeJacobian,
+            )
+        self.observables = buildObservablesFunction(context, self.expressions)
+
+    @cached_property
+    def sensitivityModel(self):
+        """
+        The model augmented with its sensitivities to every param, see
+        `SensitivityModel`, built the first time it's needed.
+        """
+        from .sensitivity import SensitivityModel
+
+        return SensitivityModel(self)
+
+    def __getstate__(self):
+        # generated functions can't be pickled, rebuild them on the other side
+        return {"context": self.context, "backend": self.backend}
+
+    def __setstate__(self, state):
+        self.__init__(state["context"], state["backend"])
+
+    def preconditionValues(self, params, initialConditions):
+        """
+        Whether each precondition holds, `params` and `initialConditions` are
+        lists of numbers in the order of the context.
+        """
+        out = np.zeros(len(self.preconditions), dtype=bool)
+        return self.preconditionsFunction(*params, *initialConditions, out)
+
+    def variableValues(self, params, initialConditions):
+        out = np.empty(len(self.variables))
+        return self.variablesFunction(*params, *initialConditions, out).tolist()
+
+    def odeArgs(self, values):
+        """
+        Extra arguments for the solver to pass along to `odeModel` and
+        `odeJacobian`: the variable values followed by fresh output buffers,
+        allocated once per solve.
+        """
+        size = len(self.context.compartments)
+        return tuple(float(v) for v in values) + (
+            np.empty(size),
+            np.zeros((size, size)),
+        )
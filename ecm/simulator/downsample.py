@@ -0,0 +1,55 @@
+import numpy as np
+from .result import SimulationResult
+
+
+def lttbIndices(timeline, series, maxPoints):
+    """
+    Largest triangle three buckets over several series sharing `timeline`.
+    `series` is a (time, k) array, the point kept in each bucket is the one
+    whose triangle with the previous kept point and the next bucket's mean is
+    the largest in any of the series, each scaled to its own range so the
+    largest one doesn't decide for the rest. Returns the sorted indices of
+    at most `maxPoints` points, always keeping the first and the last.
+    """
+    size = len(timeline)
+    if size <= maxPoints:
+        return np.arange(size)
+
+    x = (timeline - timeline[0]) / (timeline[-1] - timeline[0])
+    span = np.ptp(series, axis=0)
+    y = (series - series.min(axis=0)) / np.where(span > 0, span, 1)
+
+    # interior points split in maxPoints - 2 buckets, the ends are kept
+    edges = np.linspace(1, size - 1, maxPoints - 1).astype(int)
+    indices = np.empty(maxPoints, dtype=int)
+    indices[0], indices[-1] = 0, size - 1
+    for bucket in range(maxPoints - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        nextEnd = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        nextX = x[end:nextEnd].mean()
+        nextY = y[end:nextEnd].mean(axis=0)
+        a = indices[bucket]
+        areas = np.abs(
+            (x[a] - nextX) * (y[start:end] - y[a])
+            - (x[a] - x[start:end, np.newaxis]) * (nextY - y[a])
+        ).max(axis=1)
+        indices[bucket + 1] = start + np.argmax(areas)
+    return indices
+
+
+def downsample(result: SimulationResult, maxPoints):
+    """
+    Copy of `result` keeping at most `maxPoints` timepoints, picked by
+    `lttbIndices` over every series of every frame so they all still share
+    one timeline.
+    """
+    frames = np.stack(result.frames)
+    series = frames.transpose(1, 0, 2).reshape(len(result.timeline), -1)
+    indices = lttbIndices(result.timeline, series, maxPoints)
+
+    decimated = SimulationResult(result.compartments, result.timeline[indices])
+    decimated.frames = list(frames[:, indices])
+    decimated.param, decimated.paramValues = result.param, result.paramValues
+    decimated.params = result.params
+    decimated.initialConditions = result.initialConditions
+    return decimated
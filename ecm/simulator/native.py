@@ -0,0 +1,252 @@
+import hashlib
+import logging
+import os
+import stat
+import subprocess
+import sys
+import sysconfig
+import tempfile
+from importlib.machinery import ExtensionFileLoader
+from importlib.util import module_from_spec, spec_from_file_location
+from pathlib import Path
+from sympy import Matrix, Symbol, cse, numbered_symbols, sympify
+from sympy.printing.c import C99CodePrinter
+from .base import ModelContext
+
+CFLAGS = ["-O2", "-shared", "-fPIC"]
+
+logger = logging.getLogger(__name__)
+
+MODULE = """\
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+
+/* a C contiguous buffer of exactly `size` doubles */
+static int doubles(PyObject *obj, Py_buffer *view, int flags, Py_ssize_t size) {{
+    if (PyObject_GetBuffer(obj, view, flags | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {{
+        return -1;
+    }}
+    if (view->len != size * (Py_ssize_t)sizeof(double) || strcmp(view->format, "d")) {{
+        PyBuffer_Release(view);
+        PyErr_Format(PyExc_ValueError, "expected %zd float64 values", size);
+        return -1;
+    }}
+    return 0;
+}}
+
+{functions}
+
+static PyMethodDef methods[] = {{
+{methods}
+    {{NULL, NULL, 0, NULL}}
+}};
+
+static struct PyModuleDef module = {{PyModuleDef_HEAD_INIT, "{name}", NULL, -1, methods}};
+
+PyMODINIT_FUNC PyInit_{name}(void) {{
+    return PyModule_Create(&module);
+}}
+"""
+
+# `name(z, t, *odeVariables, out, jac)`, same as the numpy functions, writes
+# into its `buffer` argument and returns it
+FUNCTION = """\
+static void compute_{name}(const double *z, double t, const double *v, double *{buffer}) {{
+{body}
+}}
+
+static PyObject *{name}(PyObject *self, PyObject *const *args, Py_ssize_t nargs) {{
+    Py_buffer zview, bufferview;
+    double v[{variables} + 1];
+    if (nargs != {variables} + 4) {{
+        PyErr_SetString(PyExc_TypeError, "{name} takes {variables} + 4 arguments");
+        return NULL;
+    }}
+    double t = PyFloat_AsDouble(args[1]);
+    for (Py_ssize_t i = 0; i < {variables}; i++) {{
+        v[i] = PyFloat_AsDouble(args[i + 2]);
+    }}
+    if (PyErr_Occurred()) {{
+        return NULL;
+    }}
+    PyObject *buffer = args[{position}];
+    if (doubles(args[0], &zview, PyBUF_SIMPLE, {size}) < 0) {{
+        return NULL;
+    }}
+    if (doubles(buffer, &bufferview, PyBUF_WRITABLE, {length}) < 0) {{
+        PyBuffer_Release(&zview);
+        return NULL;
+    }}
+    compute_{name}(zview.buf, t, v, bufferview.buf);
+    PyBuffer_Release(&zview);
+    PyBuffer_Release(&bufferview);
+    Py_INCREF(buffer);
+    return buffer;
+}}
+"""
+
+
+class NativeUnavailable(Exception):
+    pass
+
+
+class CPrinter(C99CodePrinter):
+    def _print_not_supported(self, expr):
+        raise NativeUnavailable(f"{expr} can't be written in C")
+
+
+def cacheDir():
+    """
+    Where compiled models are kept, shared by every process of the user
+    running the app. Libraries in it are loaded into the process, so it's
+    created private and refused when anyone else could have written to it.
+    """
+    default = Path(tempfile.gettempdir()) / f"ecm-native-{os.geteuid()}"
+    path = Path(os.environ.get("ECM_NATIVE_CACHE_DIR", default))
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = path.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid():
+        raise NativeUnavailable(f"{path} isn't a directory owned by this user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise NativeUnavailable(f"{path} is writable by other users")
+    return path
+
+
+def __functionSource(context: ModelContext, name, buffer, outputs, length):
+    """
+    C function computing each `(index, expression)` of `outputs` into
+    `buffer`, compartments are read from `z` and ode variables from `v`.
+    """
+    # symbols printed as the array items
+    symbols = {
+        **{s: Symbol(f"z[{i}]") for i, s in enumerate(context.compartments.values())},
+        **{s: Symbol(f"v[{i}]") for i, s in enumerate(context.odeVariables)},
+    }
+    exprs = [sympify(expr).xreplace(symbols) for _, expr in outputs]
+    known = {Symbol("t"), *symbols.values()}
+    for expr in exprs:
+        if not expr.free_symbols <= known:
+            raise NativeUnavailable(f"Unknown symbols {expr.free_symbols - known}")
+
+    printer = CPrinter()
+    replacements, reduced = cse(exprs, symbols=numbered_symbols("x"))
+    body = [f"    const double {s} = {printer.doprint(e)};" for s, e in replacements]
+    body += [
+        f"    {buffer}[{index}] = {printer.doprint(expr)};"
+        for (index, _), expr in zip(outputs, reduced)
+    ]
+    variables = len(context.odeVariables)
+    return FUNCTION.format(
+        name=name,
+        buffer=buffer,
+        body="\n".join(body),
+        variables=variables,
+        size=len(context.compartments),
+        length=length,
+        position=variables + (2 if buffer == "out" else 3),
+    )
+
+
+def moduleSource(context: ModelContext, name):
+    """
+    C source of the extension module `name` with the `ode_model` and
+    `ode_jacobian` functions of `context`.
+    """
+    size = len(context.compartments)
+    jacobian = Matrix(list(context.formulas.values())).jacobian(
+        list(context.compartments.values())
+    )
+    model = list(enumerate(context.formulas.values()))
+    # entries that are always zero are never written, like the numpy jacobian
+    entries = [
+        (i * size + j, jacobian[i, j])
+        for i in range(size)
+        for j in range(size)
+        if jacobian[i, j] != 0
+    ]
+    functions = [
+        __functionSource(context, "ode_model", "out", model, size),
+        __functionSource(context, "ode_jacobian", "jac", entries, size * size),
+    ]
+    methods = [
+        f'    {{"{f}", (PyCFunction)(void (*)(void)){f}, METH_FASTCALL, NULL}},'
+        for f in ["ode_model", "ode_jacobian"]
+    ]
+    return MODULE.format(
+        name=name, functions="\n".join(functions), methods="\n".join(methods)
+    )
+
+
+def compileModule(name, source, path: Path):
+    """
+    Builds the extension `name` from `source` into `path`. The library is
+    written next to it first and then renamed, so other processes never load
+    a half written one.
+    """
+    compiler = os.environ.get("CC", "cc").split()
+    include = sysconfig.get_paths()["include"]
+    with tempfile.TemporaryDirectory(dir=path.parent) as build:
+        sourcePath = Path(build) / f"{name}.c"
+        sourcePath.write_text(source)
+        output = Path(build) / path.name
+        command = [
+            *compiler,
+            *CFLAGS,
+            f"-I{include}",
+            str(sourcePath),
+            "-o",
+            str(output),
+        ]
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(output, path)
+
+
+def nativeModule(context: ModelContext):
+    """
+    Extension module with the `ode_model` and `ode_jacobian` of `context`
+    compiled to machine code, built once per model and interpreter and then
+    loaded from `cacheDir`.
+    """
+    suffix = sysconfig.get_config_var("EXT_SUFFIX")
+    # named after its own source, every edit of a model gets a new one
+    placeholder = moduleSource(context, "{name}")
+    key = "\0".join([placeholder, suffix, *CFLAGS])
+    name = f"ecm_native_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+    if name in sys.modules:
+        return sys.modules[name]
+
+    path = cacheDir() / f"{name}{suffix}"
+    if not path.exists():
+        compileModule(name, placeholder.replace("{name}", name), path)
+    spec = spec_from_file_location(
+        name, path, loader=ExtensionFileLoader(name, str(path))
+    )
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+    return module
+
+
+def buildNativeFunctions(context: ModelContext):
+    """
+    `(ode_model, ode_jacobian)` of the native module of `context`, or None
+    when it can't be built, e.g. without a C compiler or python headers, or
+    loaded, e.g. a broken library in the cache.
+    """
+    try:
+        module = nativeModule(context)
+    except (
+        NativeUnavailable,
+        OSError,
+        ImportError,
+        subprocess.CalledProcessError,
+    ) as e:
+        stderr = getattr(e, "stderr", None)
+        logger.warning(
+            "Native ode backend unavailable, using numpy: %s%s",
+            e,
+            f"\n{stderr.decode(errors='replace')}" if stderr else "",
+        )
+        return None
+    return module.ode_model, module.ode_jacobian
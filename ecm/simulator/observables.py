@@ -1,31 +1,89 @@
-from types import FunctionType
 import numpy as np
-from .base import ModelContext, SimulationResult
+from sympy import Symbol
+from .base import ModelContext
+from .result import SimulationResult, SimulatorError
+from .codegen import buildNumpyFunction, symbolNames
 
 
-def __buildFunctionObservable(compartments, name, expr):
-    # todo: support other environment variables. Only compartments are allowed in this version.
-    fstr = "def observable(row):\n"
-    fstr += f"    {', '.join(str(s) for s in compartments)}, *others = row\n"
-    fstr += f"    return {expr}"
-    fstrcode = compile(fstr, f"<{name}>", "exec")
-    return FunctionType(fstrcode.co_consts[0], globals(), name)
+def buildObservablesFunction(context: ModelContext, expressions=None):
+    """
+    `observables(frame, t, *params, *initialConditions, out)` computes every
+    observable over whole columns of `frame`, writing column i of `out` with
+    observable i. Observables may use the compartments, params, expressions,
+    initial conditions and `t`. `expressions` must be already unfolded.
+    """
+    if expressions is None:
+        expressions = context.unfoldedExpressions
 
+    initialConditions = [Symbol(f"{c}_0") for c in context.compartments]
+    known = {
+        Symbol("t"),
+        *context.compartments.values(),
+        *context.params.values(),
+        *initialConditions,
+    }
+    outputs = []
+    for idx, (name, observable) in enumerate(context.observables.items()):
+        observable = observable.subs(expressions)
+        unknown = observable.free_symbols - known
+        if unknown:
+            raise SimulatorError(
+                "observables", f"Cannot solve symbols in {name}: {list(unknown)}"
+            )
+        outputs.append((f":, {idx}", observable, name))
 
-def computeExtraColumns(context: ModelContext, result: SimulationResult):
+    args = symbolNames([Symbol("t"), *context.params.values(), *initialConditions])
+    compartments = symbolNames(context.compartments.values())
+    unpack = f"{', '.join(compartments)}, = frame.T"
+    return buildNumpyFunction(
+        "observables", ["frame", *args, "out"], [unpack], "out", outputs
+    )
+
+
+def __extendFrame(context, result, observables, frame, params, out):
+    compSize = len(context.compartments)
+    out[:, :compSize] = frame
+    observables(
+        frame,
+        result.timeline,
+        *(params[p] for p in context.params),
+        *(result.initialConditions[c] for c in context.compartments),
+        out[:, compSize:],
+    )
+    return out
+
+
+def computeExtraColumns(
+    context: ModelContext, result: SimulationResult, observables=None
+):
+    """
+    Appends a column per observable to every frame. When the frames are a
+    list they all end up as views of one array, otherwise (a streamed
+    result) each frame is extended as it's consumed.
+    """
     if len(context.observables) > 0:
-        functions = [
-            __buildFunctionObservable(result.compartments, n, o)
-            for n, o in context.observables.items()
-        ]
-        obsSize = len(context.observables)
-        compSize = len(result.compartments)
-        for findex, frame in enumerate(result.frames):
-            shape = list(frame.shape)
-            shape[1] += obsSize
-            newFrame = np.zeros(tuple(shape))
-            newFrame[:, :-obsSize] = frame
-            for idx, function in enumerate(functions):
-                newFrame[:, compSize + idx] = np.apply_along_axis(function, 1, newFrame)
-            result.frames[findex] = newFrame
+        if observables is None:
+            observables = buildObservablesFunction(context)
+        width = len(result.compartments) + len(context.observables)
+        shape = (len(result.timeline), width)
+
+        if isinstance(result.frames, list):
+            frames = np.empty((len(result.frames), *shape))
+            for findex, frame in enumerate(result.frames):
+                __extendFrame(
+                    context,
+                    result,
+                    observables,
+                    frame,
+                    result.params[findex],
+                    frames[findex],
+                )
+            result.frames = list(frames)
+        else:
+            result.frames = (
+                __extendFrame(
+                    context, result, observables, frame, params, np.empty(shape)
+                )
+                for frame, params in zip(result.frames, result.params)
+            )
         result.compartments += list(context.observables.keys())
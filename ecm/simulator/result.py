@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class SimulatorError(Exception):
+    pass
+
+
+class BudgetExceeded(SimulatorError):
+    """
+    A simulation over one of the limits of its `Budget`, with the estimated
+    cost of the simulation when it's rejected before solving anything.
+    """
+
+    def __init__(self, message, estimate=None):
+        super().__init__("budget", message)
+        self.estimate = estimate
+
+    def __reduce__(self):
+        # raised in sweep processes too
+        return BudgetExceeded, (self.args[1], self.estimate)
+
+
+class SimulationResult:
+    def __init__(
+        self, compartments, timeline, frames=None, param=None, paramValues=None
+    ):
+        self.compartments = compartments
+        self.timeline = timeline
+        self.frames = frames is not None or []
+        self.param = param is not None or []
+        self.paramValues = paramValues is not None or []
+        # params used by each frame and the initial conditions of every frame
+        self.params = []
+        self.initialConditions = {}
+        # d compartment / d param as a frame per param, see Simulator.sensitivity
+        self.sensitivities = {}
+
+    @property
+    def isIterated(self):
+        return self.param is not None
+
+    def summary(self, quantiles):
+        """
+        Mean frame and one frame per quantile, computed over every frame.
+        """
+        frames = np.stack(self.frames)
+        return np.mean(frames, axis=0), np.quantile(frames, quantiles, axis=0)
@@ -0,0 +1,99 @@
+import numpy as np
+from sympy import Matrix, Symbol
+from .codegen import buildNumpyFunction, symbolNames
+from .compiled import CompiledModel, buildValuesFunction
+
+
+class SensitivityModel:
+    """
+    The ode system of a compiled model augmented with its forward
+    sensitivities to every param, so a single solve gives the derivative of
+    each compartment with respect to each param. With the formulas `f(z, v)`
+    of the compartments `z` and ode variables `v`, the n x P sensitivities
+    `s = dz/dp` follow
+
+        ds/dt = df/dz s + df/dv dv/dp,  s(0) = 0
+
+    `dv/dp` only depends on the params and initial conditions, so it's
+    evaluated once per simulation and passed along like the variables.
+    Quacks like a `CompiledModel` for `solve`, without a jacobian.
+    """
+
+    def __init__(self, compiled: CompiledModel):
+        context = compiled.context
+        self.compiled = compiled
+        self.params = list(context.params)
+        compartments = list(context.compartments.values())
+        size, count = len(compartments), len(self.params)
+
+        # d variable k / d param p, the ones that are always zero are dropped
+        derivatives = Matrix(
+            [[v.diff(p) for p in context.params.values()] for v in compiled.variables]
+        )
+        self.derivativesFunction = buildValuesFunction(
+            context, "variable_derivatives", list(derivatives)
+        )
+        dvdp = Matrix(
+            len(compiled.variables),
+            count,
+            lambda k, p: 0 if derivatives[k, p] == 0 else Symbol(f"_d_{k}_{p}"),
+        )
+        sensitivities = Matrix(size, count, lambda i, p: Symbol(f"_s_{i}_{p}"))
+
+        formulas = Matrix(list(context.formulas.values()))
+        rates = formulas.jacobian(compartments) * sensitivities
+        if context.odeVariables:
+            rates += formulas.jacobian(context.odeVariables) * dvdp
+        names = list(context.compartments)
+        outputs = [
+            (idx, formula, compartment)
+            for idx, (compartment, formula) in enumerate(context.formulas.items())
+        ]
+        outputs += [
+            (size + i * count + p, rates[i, p], f"d{names[i]}/d{self.params[p]}")
+            for i in range(size)
+            for p in range(count)
+        ]
+        self.derivativeSymbols = [s for s in dvdp if s != 0]
+        args = [
+            "z",
+            "t",
+            *symbolNames(context.odeVariables),
+            *symbolNames(self.derivativeSymbols),
+            "out",
+            "jac",
+        ]
+        state = symbolNames([*compartments, *sensitivities])
+        unpack = f"{', '.join(state)}, = z.tolist()"
+        self.odeModel = buildNumpyFunction(
+            "sensitivity_model", args, [unpack], "out", outputs
+        )
+        self.odeJacobian = None
+        self.__derivativeIndices = [
+            k * count + p
+            for k in range(dvdp.rows)
+            for p in range(count)
+            if dvdp[k, p] != 0
+        ]
+        self.__size = size * (1 + count)
+
+    def derivativeValues(self, params, initialConditions):
+        """
+        `dv/dp` flattened row by row, for the nonzero entries only.
+        """
+        out = np.zeros(len(self.compiled.variables) * len(self.params))
+        self.derivativesFunction(*params, *initialConditions, out)
+        return out[self.__derivativeIndices].tolist()
+
+    def initialState(self, initialConditions):
+        # every sensitivity starts at zero, initial conditions aren't params
+        return np.concatenate(
+            [initialConditions, np.zeros(self.__size - len(initialConditions))]
+        )
+
+    def odeArgs(self, values):
+        """
+        Like `CompiledModel.odeArgs`, `values` are the variable values
+        followed by the `derivativeValues`.
+        """
+        return tuple(float(v) for v in values) + (np.empty(self.__size), None)
@@ -1,73 +1,287 @@
-from types import FunctionType
 from sympy import Symbol, true as BTrue, false as BFalse, Float as FloatT
-from ecm.schemas import Simulation
-from scipy.integrate import odeint
+from ecm.schemas import Simulation, Sweep
+from ecm.timing import count, stage
 import numpy as np
-from .base import ModelContext, SimulationResult, SimulatorError
+from .base import ModelContext
+from .budget import Budget
+from .result import SimulationResult, SimulatorError
+from .compiled import CompiledModel
+from .solver import solve, solveEnsemble
+from .sweep import BATCH_SIZE, batchSolve, parallelSolve, sweepPoints
 
 
 class Simulator:
-    def __init__(self, context: ModelContext):
+    def __init__(
+        self,
+        context: ModelContext,
+        compiled: CompiledModel = None,
+        processes=1,
+        progress=None,
+        budget: Budget = None,
+    ):
         self.context = context
+        self.compiled = compiled
+        # sweeps are solved on a process pool when greater than one
+        self.processes = processes
+        # called with (solved frames, total frames) as frames are solved
+        self.progress = progress
+        # limits every simulation and extension, see Budget
+        self.budget = budget
 
-    def simulate(self, simulation: Simulation):
+    def simulate(self, simulation: Simulation, stream=False):
+        """
+        With `stream` the frames of an iterate simulation are solved as
+        `result.frames` is consumed instead of up front, preconditions are
+        still validated before returning.
+        """
+        if self.budget is not None:
+            self.budget.start(simulation)
+        if self.compiled is None:
+            self.compiled = CompiledModel(self.context)
         timeline = np.arange(0, simulation.days, simulation.step)
-        odeModel = self.__buildOdeModelFunction()
-        preconditions, initialConditions, variables = self.__preprocessVariables(
-            simulation
-        )
+        solver = simulation.solver
+        initialConditions = self.__initialConditions(simulation.initial_conditions)
         result = SimulationResult(list(self.context.compartments.keys()), timeline)
-        if simulation.iterate:
+        result.initialConditions = simulation.initial_conditions
+        if isinstance(simulation.iterate, Sweep):
+            result.param = [axis.key for axis in simulation.iterate.axes]
+            result.paramValues = sweepPoints(simulation.iterate)
+            with stage("validate"):
+                frameValues = self.__frameValues(
+                    result, simulation, initialConditions, result.paramValues
+                )
+            count("frames", len(frameValues))
+            with stage("solve"):
+                result.frames = list(
+                    batchSolve(
+                        self.compiled,
+                        solver,
+                        list(initialConditions.values()),
+                        timeline,
+                        frameValues,
+                        self.processes,
+                        self.progress,
+                        self.budget,
+                    )
+                )
+        elif simulation.iterate:
             it = simulation.iterate
             result.paramValues = np.linspace(it.start, it.end, it.intervals)
             result.param = it.key
-            tsimulation = simulation.copy()
-            for value in result.paramValues:
-                tsimulation.params[it.key] = value
-                tvariables = variables[:]
-                tpreconditions = preconditions.copy()
-                self.__validatePreconditions(tpreconditions, tsimulation.params)
+            with stage("validate"):
+                frameValues = self.__frameValues(
+                    result,
+                    simulation,
+                    initialConditions,
+                    result.paramValues[:, np.newaxis],
+                )
+            count("frames", len(frameValues))
+            result.frames = self.__solveFrames(
+                solver,
+                list(initialConditions.values()),
+                timeline,
+                frameValues,
+                it.ensemble,
+            )
+            if self.progress is not None:
+                result.frames = self.__reportProgress(result.frames, len(frameValues))
+            if not stream:
+                with stage("solve"):
+                    result.frames = list(result.frames)
+        else:
+            with stage("validate"):
+                values = self.__checkedValues(simulation.params, initialConditions)
+            count("frames")
+            result.params.append(simulation.params)
+            with stage("solve"):
                 result.frames.append(
-                    self.__singleSimulate(
-                        odeModel,
-                        initialConditions,
-                        tvariables,
-                        tsimulation.params,
+                    solve(
+                        self.compiled,
+                        solver,
+                        list(initialConditions.values()),
                         timeline,
+                        values,
+                        self.budget,
                     )
                 )
-        else:
-            self.__validatePreconditions(preconditions, simulation.params)
-            result.frames.append(
-                self.__singleSimulate(
-                    odeModel, initialConditions, variables, simulation.params, timeline
-                )
-            )
+            if self.progress is not None:
+                self.progress(1, 1)
         return result
 
-    def __preprocessVariables(self, simulation):
-        # TODO: refactor this, is ugly
-        ModelContext.unfoldExpression(self.context.expressions)
+    def extend(self, simulation: Simulation, previous: SimulationResult):
+        """
+        Result of `simulation` from `previous`, the result of the same
+        simulation over less days. Each frame is integrated from its last
+        state, with the params it was solved with, over the new days only.
+        Observables in `previous` are dropped, like `simulate` the result
+        only has the compartments.
+        """
+        if self.budget is not None:
+            self.budget.start(simulation)
+        if self.compiled is None:
+            self.compiled = CompiledModel(self.context)
+        timeline = np.arange(0, simulation.days, simulation.step)
+        start = len(previous.timeline) - 1
+        if not np.array_equal(timeline[: start + 1], previous.timeline):
+            raise SimulatorError("simulate", "Cannot extend a different timeline")
 
         initialConditions = self.__initialConditions(simulation.initial_conditions)
+        with stage("validate"):
+            frameValues = [
+                self.__checkedValues(params, initialConditions)
+                for params in previous.params
+            ]
+        count("frames", len(frameValues))
 
-        preconditions = self.context.preconditions.copy()
-        variables = list(self.context.odeVariables)
+        size = len(self.context.compartments)
+        states = np.array([frame[-1, :size] for frame in previous.frames])
+        with stage("solve"):
+            tails = self.__solveTails(simulation, states, timeline[start:], frameValues)
 
-        # Replace variable to expression and initial conditions
-        for i in range(len(variables)):
-            variables[i] = (
-                variables[i].subs(self.context.expressions).subs(initialConditions)
+        result = SimulationResult(list(self.context.compartments.keys()), timeline)
+        result.param, result.paramValues = previous.param, previous.paramValues
+        result.params = previous.params
+        result.initialConditions = simulation.initial_conditions
+        result.frames = [
+            np.concatenate([frame[:, :size], tail[1:]])
+            for frame, tail in zip(previous.frames, tails)
+        ]
+        return result
+
+    def sensitivity(self, simulation: Simulation):
+        """
+        Result of a simulation without `iterate` along with the sensitivity
+        of every compartment to every param of the model, all of them
+        integrated together by a single solve.
+        """
+        if simulation.iterate is not None:
+            raise SimulatorError("simulate", "Sensitivities can't be iterated")
+        if self.budget is not None:
+            self.budget.start(simulation)
+        if self.compiled is None:
+            self.compiled = CompiledModel(self.context)
+        timeline = np.arange(0, simulation.days, simulation.step)
+        initialConditions = self.__initialConditions(simulation.initial_conditions)
+        with stage("validate"):
+            values = self.__checkedValues(simulation.params, initialConditions)
+            model = self.compiled.sensitivityModel
+            values += model.derivativeValues(
+                self.__paramValues(simulation.params),
+                list(initialConditions.values()),
+            )
+        count("frames")
+        with stage("solve"):
+            states = solve(
+                model,
+                simulation.solver,
+                model.initialState(list(initialConditions.values())),
+                timeline,
+                values,
+                self.budget,
             )
 
-        for name, predExpr in preconditions.items():
-            preconditions[name] = (
-                preconditions[name]
-                .subs(self.context.expressions)
-                .subs(initialConditions)
+        size = len(self.context.compartments)
+        result = SimulationResult(list(self.context.compartments.keys()), timeline)
+        result.params.append(simulation.params)
+        result.initialConditions = simulation.initial_conditions
+        result.frames.append(states[:, :size])
+        # each compartment's sensitivities are laid out param by param
+        sensitivities = states[:, size:].reshape(len(timeline), size, -1)
+        result.sensitivities = {
+            param: sensitivities[:, :, p] for p, param in enumerate(model.params)
+        }
+        return result
+
+    def __solveTails(self, simulation, states, tspan, frameValues):
+        """
+        Solves each frame like `simulate` would have, ensembles are solved
+        together again, serially.
+        """
+        it = simulation.iterate
+        if isinstance(it, Sweep) or (it is not None and it.ensemble):
+            tails = []
+            for offset in range(0, len(frameValues), BATCH_SIZE):
+                end = offset + BATCH_SIZE
+                tails += solveEnsemble(
+                    self.compiled,
+                    simulation.solver,
+                    states[offset:end],
+                    tspan,
+                    frameValues[offset:end],
+                    self.budget,
+                )
+            return tails
+        return [
+            solve(self.compiled, simulation.solver, state, tspan, values, self.budget)
+            for state, values in zip(states, frameValues)
+        ]
+
+    def __reportProgress(self, frames, total):
+        for done, frame in enumerate(frames, 1):
+            self.progress(done, total)
+            yield frame
+
+    def __frameValues(self, result, simulation, initialConditions, points):
+        keys = result.param if isinstance(result.param, list) else [result.param]
+        tsimulation = simulation.copy()
+        frameValues = []
+        for point in points:
+            tsimulation.params.update(zip(keys, point))
+            result.params.append(dict(tsimulation.params))
+            frameValues.append(
+                self.__checkedValues(tsimulation.params, initialConditions)
             )
+        return frameValues
+
+    def __checkedValues(self, params, initialConditions):
+        """
+        Values of the ode variables for `params`, once every precondition is
+        validated. Both are evaluated with numbers, sympy is only used to
+        write the error of what can't be solved.
+        """
+        paramValues = self.__paramValues(params)
+        initialValues = list(initialConditions.values())
+        holds = self.compiled.preconditionValues(paramValues, initialValues)
+        for idx, (name, predExpr) in enumerate(self.compiled.preconditions.items()):
+            if name in self.compiled.unsolvedPreconditions:
+                predExpr = predExpr.subs(initialConditions)
+                self.__validatePreconditions({name: predExpr}, params)
+            elif not holds[idx]:
+                raise SimulatorError(
+                    "simulate", f"Precondition not satisisfied: {name}"
+                )
+
+        if self.compiled.unsolvedVariables:
+            variables = [v.subs(initialConditions) for v in self.compiled.variables]
+            self.__resolveVariables(variables, params)
+        return self.compiled.variableValues(paramValues, initialValues)
 
-        return preconditions, list(initialConditions.values()), variables
+    def __solveFrames(self, solver, initialConditions, timeline, frameValues, ensemble):
+        if ensemble:
+            return solveEnsemble(
+                self.compiled,
+                solver,
+                initialConditions,
+                timeline,
+                frameValues,
+                self.budget,
+            )
+        if self.processes > 1 and len(frameValues) > 1:
+            return parallelSolve(
+                self.compiled,
+                solver,
+                initialConditions,
+                timeline,
+                frameValues,
+                self.processes,
+                self.budget,
+            )
+        return (
+            solve(
+                self.compiled, solver, initialConditions, timeline, values, self.budget
+            )
+            for values in frameValues
+        )
 
     def __validatePreconditions(self, preconditions, params):
         varParams = self.__varParams(params)
@@ -97,6 +311,12 @@ class Simulator:
             )
         return initialConditions
 
+    def __paramValues(self, params):
+        try:
+            return [params[p] for p in self.context.params]
+        except KeyError as e:
+            raise SimulatorError("simulate", f"Missing parameter {e}")
+
     def __varParams(self, params):
         varParams = {}
         try:
@@ -105,7 +325,7 @@ class Simulator:
             raise SimulatorError("simulate", f"Missing parameter {e}")
         return varParams
 
-    def __singleSimulate(self, odeModel, initialConditions, variables, params, tspan):
+    def __resolveVariables(self, variables, params):
         varParams = self.__varParams(params)
 
         # Replace param values
@@ -118,16 +338,4 @@ class Simulator:
             raise SimulatorError(
                 "simulate", f"Cannot solve symbols: {missingVariables}"
             )
-        return odeint(
-            odeModel, initialConditions, tspan, args=tuple(float(v) for v in variables)
-        )
-
-    def __buildOdeModelFunction(self):
-        modelstr = f"def ode_model(z, t, {', '.join(str(s) for s in self.context.odeVariables)}):\n"
-        modelstr += f"    dz = [0]*{len(self.context.compartments)}\n"
-        modelstr += f"    {', '.join(self.context.compartments.keys())} = z\n"
-        for idx, (compartment, formula) in enumerate(self.context.formulas.items()):
-            modelstr += f"    dz[{idx}] = {formula} # {compartment}\n"
-        modelstr += "    return dz"
-        modelcode = compile(modelstr, "<odeModel>", "exec")
-        return FunctionType(modelcode.co_consts[0], globals(), "ode_model")
+        return [float(v) for v in variables]
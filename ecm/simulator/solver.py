@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.integrate import odeint, solve_ivp
+from scipy.sparse import block_diag
+from ecm.schemas.simulation import Solver
+from ecm import timing
+from .budget import Budget
+from .result import SimulatorError
+from .compiled import CompiledModel
+
+# methods that make use of the jacobian
+IMPLICIT_METHODS = ["LSODA", "BDF", "Radau"]
+
+
+def __odeintCalls(info):
+    # cumulative evaluations after each timepoint, none for a single one
+    return int(info["nfe"][-1]) if len(info["nfe"]) else 0
+
+
+def __tolerances(solver: Solver):
+    tolerances = {"rtol": solver.rtol, "atol": solver.atol}
+    return {k: v for k, v in tolerances.items() if v is not None}
+
+
+def solve(
+    compiled: CompiledModel,
+    solver: Solver,
+    initialConditions,
+    tspan,
+    values,
+    budget: Budget = None,
+):
+    """
+    Integrates the compiled model from `initialConditions` over `tspan` with
+    the numeric `values` of its ode variables. Without a solver it goes
+    through odeint, otherwise through solve_ivp with the requested method.
+    Every evaluation of the model is charged to `budget`. Models without
+    a jacobian have it estimated by the solvers.
+    """
+    odeModel, odeJacobian = compiled.odeModel, compiled.odeJacobian
+    if budget is not None:
+        odeModel = budget.watch(odeModel)
+    args = compiled.odeArgs(values)
+    if solver is None:
+        states, info = odeint(
+            odeModel,
+            initialConditions,
+            tspan,
+            args=args,
+            Dfun=odeJacobian,
+            full_output=True,
+        )
+        timing.count("rhs_calls", __odeintCalls(info))
+        return states
+
+    if tspan[0] == tspan[-1]:
+        return np.array([initialConditions], dtype=float)
+
+    # solve_ivp keeps previous evaluations around, copy them out of the buffers
+    options = {"method": solver.method, "t_eval": tspan, "args": args}
+    if solver.method in IMPLICIT_METHODS and odeJacobian is not None:
+        options["jac"] = lambda t, z, *args: odeJacobian(z, t, *args).copy()
+    options.update(__tolerances(solver))
+    solution = solve_ivp(
+        lambda t, z, *args: np.array(odeModel(z, t, *args)),
+        (tspan[0], tspan[-1]),
+        initialConditions,
+        **options,
+    )
+    if not solution.success:
+        raise SimulatorError("simulate", f"Solver failed: {solution.message}")
+    timing.count("rhs_calls", solution.nfev)
+    return solution.y.T
+
+
+def solveEnsemble(
+    compiled: CompiledModel,
+    solver: Solver,
+    initialConditions,
+    tspan,
+    frameValues,
+    budget: Budget = None,
+):
+    """
+    Solves every item of `frameValues` at once, stacking the K states in a
+    single system of K * n equations. `initialConditions` is either shared by
+    every frame or a (K, n) array with a row per frame. Variables that change between frames
+    are passed to the vectorized model as arrays of K values. Each state only
+    depends on its own block of n equations, which is told to the solvers so
+    they don't estimate the rest of the jacobian.
+    """
+    initialConditions = np.asarray(initialConditions, dtype=float)
+    size, count = initialConditions.shape[-1], len(frameValues)
+    columns = np.array(frameValues, dtype=float).T
+    values = [c[0] if np.all(c == c[0]) else c for c in columns]
+    odeModel = compiled.vectorOdeModel
+    out = np.empty((size, count))
+
+    # the state is laid out frame by frame, odeModel wants it compartment first
+    def ensembleModel(z, t):
+        odeModel(z.reshape(count, size).T, t, *values, out, None)
+        return out.T.ravel()
+
+    if budget is not None:
+        ensembleModel = budget.watch(ensembleModel)
+
+    initialState = np.broadcast_to(initialConditions, (count, size)).ravel()
+    if solver is None:
+        states, info = odeint(
+            ensembleModel,
+            initialState,
+            tspan,
+            ml=size - 1,
+            mu=size - 1,
+            full_output=True,
+        )
+        timing.count("rhs_calls", __odeintCalls(info))
+    elif tspan[0] == tspan[-1]:
+        states = initialState[np.newaxis, :]
+    else:
+        options = {"method": solver.method, "t_eval": tspan}
+        if solver.method in IMPLICIT_METHODS:
+            options["jac_sparsity"] = block_diag([np.ones((size, size))] * count)
+        options.update(__tolerances(solver))
+        solution = solve_ivp(
+            lambda t, z: ensembleModel(z, t),
+            (tspan[0], tspan[-1]),
+            initialState,
+            **options,
+        )
+        if not solution.success:
+            raise SimulatorError("simulate", f"Solver failed: {solution.message}")
+        timing.count("rhs_calls", solution.nfev)
+        states = solution.y.T
+
+    states = states.reshape(len(tspan), count, size)
+    return [states[:, k, :] for k in range(count)]
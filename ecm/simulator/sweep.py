@@ -0,0 +1,151 @@
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import qmc
+from ecm.schemas.simulation import Axis, Solver, Sweep
+from .budget import Budget
+from .compiled import CompiledModel
+from .solver import solve, solveEnsemble
+
+# frames integrated together as one ensemble when solving a sweep
+BATCH_SIZE = 64
+
+# set once per worker process by the pool initializer
+__worker = None
+
+
+def __initWorker(compiled, solver, initialConditions, tspan, budget):
+    global __worker
+    __worker = (compiled, solver, initialConditions, tspan, budget)
+
+
+def __solveFrame(values):
+    compiled, solver, initialConditions, tspan, budget = __worker
+    return solve(compiled, solver, initialConditions, tspan, values, budget)
+
+
+def __solveFrames(frameValues):
+    return [__solveFrame(values) for values in frameValues]
+
+
+def __solveBatch(frameValues):
+    compiled, solver, initialConditions, tspan, budget = __worker
+    return np.stack(
+        solveEnsemble(compiled, solver, initialConditions, tspan, frameValues, budget)
+    )
+
+
+def __axisValues(axis: Axis):
+    if axis.space == "values":
+        return np.array(axis.values, dtype=float)
+    if axis.space == "logspace":
+        return np.geomspace(axis.start, axis.end, axis.intervals)
+    return np.linspace(axis.start, axis.end, axis.intervals)
+
+
+def __scaleSamples(axis: Axis, samples):
+    if axis.space == "logspace":
+        low, high = np.log(axis.start), np.log(axis.end)
+        return np.exp(low + samples * (high - low))
+    return axis.start + samples * (axis.end - axis.start)
+
+
+def sweepPoints(sweep: Sweep):
+    """
+    Parameter points of the sweep, one row per point and one column per axis.
+    """
+    if sweep.sampler == "grid":
+        grid = itertools.product(*(__axisValues(a) for a in sweep.axes))
+        return np.array(list(grid), dtype=float)
+
+    sampler = qmc.LatinHypercube(d=len(sweep.axes), seed=sweep.seed)
+    samples = sampler.random(sweep.samples)
+    return np.column_stack(
+        [__scaleSamples(a, samples[:, i]) for i, a in enumerate(sweep.axes)]
+    )
+
+
+def batchSolve(
+    compiled: CompiledModel,
+    solver: Solver,
+    initialConditions,
+    tspan,
+    frameValues,
+    processes,
+    progress=None,
+    budget: Budget = None,
+):
+    """
+    Solves large amounts of frames as ensembles of `BATCH_SIZE` frames, on a
+    pool of `processes` workers when greater than one. Frames are written
+    into a single (frames, time, compartments) array, `progress` is called
+    with the frames solved so far and the total after each batch. Each
+    worker charges its evaluations to its own copy of `budget`.
+    """
+    frames = np.empty((len(frameValues), len(tspan), len(initialConditions)))
+    batches = np.array_split(
+        np.array(frameValues, dtype=float).reshape(len(frameValues), -1),
+        range(BATCH_SIZE, len(frameValues), BATCH_SIZE),
+    )
+    if processes > 1 and len(batches) > 1:
+        pool = ProcessPoolExecutor(
+            min(processes, len(batches)),
+            initializer=__initWorker,
+            initargs=(compiled, solver, initialConditions, tspan, budget),
+        )
+        with pool:
+            solved = list(pool.map(__solveBatch, batches))
+    else:
+        solved = (
+            solveEnsemble(compiled, solver, initialConditions, tspan, batch, budget)
+            for batch in batches
+        )
+
+    offset = 0
+    for batch in solved:
+        end = offset + len(batch)
+        frames[offset:end] = batch
+        offset = end
+        if progress is not None:
+            progress(offset, len(frames))
+    return frames
+
+
+def parallelSolve(
+    compiled: CompiledModel,
+    solver: Solver,
+    initialConditions,
+    tspan,
+    frameValues,
+    processes,
+    budget: Budget = None,
+):
+    """
+    Solves one frame per item of `frameValues` on a pool of `processes`
+    workers. Everything but the variable values is sent to each worker once
+    when it starts, frames are yielded in the same order as `frameValues` as
+    soon as they are ready. Closing the generator cancels pending frames.
+    Workers charge their evaluations to their own copy of `budget`, whether
+    the simulation was cancelled is checked between chunks.
+    """
+    processes = min(processes, len(frameValues))
+    pool = ProcessPoolExecutor(
+        processes,
+        initializer=__initWorker,
+        initargs=(compiled, solver, initialConditions, tspan, budget),
+    )
+    chunksize = max(1, len(frameValues) // (processes * 4))
+    futures = []
+    try:
+        for offset in range(0, len(frameValues), chunksize):
+            end = offset + chunksize
+            futures.append(pool.submit(__solveFrames, frameValues[offset:end]))
+        for future in futures:
+            if budget is not None:
+                budget.checkpoint()
+            yield from future.result()
+    finally:
+        # shutdown(cancel_futures=True) needs python 3.9
+        for future in futures:
+            future.cancel()
+        pool.shutdown()
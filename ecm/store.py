@@ -0,0 +1,193 @@
+import hashlib
+import json
+import shutil
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from sqlalchemy import func
+from . import schemas
+from .models import db, Simulation
+from .simulator import modelHash
+from .simulator.result import SimulationResult
+
+# fields that only shape the response, runs are stored without them
+RESPONSE_FIELDS = {"max_points"}
+
+
+def simulationHash(simulation: schemas.Simulation, exclude=None):
+    """
+    Hash of the normalized simulation without the `exclude` fields, None for
+    simulations that aren't reproducible: an unseeded latin hypercube draws
+    different samples every time.
+    """
+    sweep = simulation.iterate
+    if isinstance(sweep, schemas.Sweep) and sweep.sampler == "lhs":
+        if sweep.seed is None:
+            return None
+    normalized = simulation.json(sort_keys=True, exclude=exclude)
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+class ResultStore:
+    """
+    Finished runs on disk, a directory per stored simulation with the frames
+    as a (frames, compartments, time) `frames.npy`, so every compartment is a
+    contiguous column, next to the timeline and the parameter values. Frames
+    are memory mapped when loaded, slicing a time range only reads it.
+    """
+
+    def __init__(self, path=None, maxSize=0):
+        self.path = Path(path) if path else None
+        # bytes of every stored run together, 0 for no limit
+        self.maxSize = maxSize
+
+    def init_app(self, app):
+        self.path = Path(app.config["RESULT_STORE_DIR"])
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.maxSize = app.config["RESULT_STORE_SIZE"]
+
+    def save(self, runId, result: SimulationResult):
+        """
+        Writes `result` as the run `runId`, returns the bytes it takes.
+        """
+        directory = self.path / str(runId)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "frames.npy", np.stack(result.frames).transpose(0, 2, 1))
+        np.save(directory / "timeline.npy", result.timeline)
+        np.save(directory / "paramValues.npy", np.asarray(result.paramValues))
+        meta = {
+            "compartments": result.compartments,
+            "param": result.param,
+            "params": result.params,
+            "initialConditions": result.initialConditions,
+        }
+        (directory / "meta.json").write_text(json.dumps(meta))
+        return sum(f.stat().st_size for f in directory.iterdir())
+
+    def load(self, runId, start=None, end=None) -> SimulationResult:
+        """
+        The stored result with the timepoints in [`start`, `end`).
+        """
+        directory = self.path / str(runId)
+        meta = json.loads((directory / "meta.json").read_text())
+        timeline = np.load(directory / "timeline.npy")
+        first, last = np.searchsorted(
+            timeline,
+            [
+                timeline[0] if start is None else start,
+                timeline[-1] + 1 if end is None else end,
+            ],
+        )
+        frames = np.load(directory / "frames.npy", mmap_mode="r")[:, :, first:last]
+        paramValues = np.load(directory / "paramValues.npy")
+
+        result = SimulationResult(meta["compartments"], timeline[first:last])
+        result.frames = [frame.T for frame in frames]
+        result.param = meta["param"]
+        result.paramValues = paramValues if paramValues.ndim else paramValues.item()
+        result.params = meta["params"]
+        result.initialConditions = meta["initialConditions"]
+        return result
+
+    def delete(self, runId):
+        shutil.rmtree(self.path / str(runId), ignore_errors=True)
+
+    def clear(self):
+        for directory in self.path.iterdir():
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+resultStore = ResultStore()
+
+
+def findSimulation(model: schemas.Model, simulation: schemas.Simulation):
+    """
+    A finished run of `simulation` on this exact definition of `model`.
+    """
+    hash = simulationHash(simulation, exclude=RESPONSE_FIELDS)
+    if hash is None:
+        return None
+    return (
+        Simulation.query.filter_by(
+            model_hash=modelHash(model), simulation_hash=hash, status="done"
+        )
+        .order_by(Simulation.id)
+        .first()
+    )
+
+
+def findPreviousSimulation(model: schemas.Model, simulation: schemas.Simulation):
+    """
+    The longest finished run of `simulation` over less days, which
+    `Simulator.extend` can continue.
+    """
+    hash = simulationHash(simulation, exclude={"days", *RESPONSE_FIELDS})
+    if hash is None:
+        return None
+    return (
+        Simulation.query.filter_by(
+            model_hash=modelHash(model), base_hash=hash, status="done"
+        )
+        .filter(Simulation.days < simulation.days)
+        .order_by(Simulation.days.desc())
+        .first()
+    )
+
+
+def simulationColumns(model: schemas.Model, simulation: schemas.Simulation):
+    """
+    Columns of the simulation table for a run of `simulation` on `model`.
+    """
+    return dict(
+        model=model.id,
+        model_hash=modelHash(model),
+        simulation_hash=simulationHash(simulation, exclude=RESPONSE_FIELDS),
+        base_hash=simulationHash(simulation, exclude={"days", *RESPONSE_FIELDS}),
+        **simulation.dict(exclude=RESPONSE_FIELDS),
+    )
+
+
+def saveSimulation(
+    model: schemas.Model, simulation: schemas.Simulation, result: SimulationResult
+):
+    run = Simulation(
+        status="done",
+        progress=1,
+        finished=datetime.utcnow(),
+        **simulationColumns(model, simulation),
+    )
+    db.session.add(run)
+    db.session.flush()
+    run.size = resultStore.save(run.id, result)
+    db.session.commit()
+    evictSimulations(keep=run.id)
+    return run
+
+
+def evictSimulations(keep=None):
+    """
+    Deletes the oldest finished runs, rows and frames, until the stored ones
+    take at most `resultStore.maxSize` bytes. The run `keep`, just saved, is
+    kept even when it's larger on its own.
+    """
+    if not resultStore.maxSize:
+        return
+    done = Simulation.query.filter_by(status="done")
+    total = done.with_entities(func.sum(Simulation.size)).scalar() or 0
+    if total <= resultStore.maxSize:
+        return
+    evicted = []
+    for run in done.filter(Simulation.size.isnot(None)).order_by(Simulation.finished):
+        if total <= resultStore.maxSize:
+            break
+        if run.id == keep:
+            continue
+        total -= run.size
+        evicted.append(run.id)
+    Simulation.query.filter(Simulation.id.in_(evicted)).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    # frames last, a run is never found without them
+    for runId in evicted:
+        resultStore.delete(runId)
@@ -0,0 +1,97 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+__timings = ContextVar("timings", default=None)
+
+
+class Timings:
+    """
+    Time spent in each named stage of a request, plus named counts of what
+    it did. Stages can nest, a stage only counts its own time, not the time
+    of the stages inside it, so the durations add up to at most the total.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self.__running = []
+        self.__since = self.start
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    @contextmanager
+    def stage(self, name):
+        self.__switch()
+        self.__running.append(name)
+        try:
+            yield
+        finally:
+            self.__switch()
+            self.__running.pop()
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def serverTiming(self):
+        """
+        The durations as a `Server-Timing` header value, in milliseconds.
+        """
+        metrics = [*self.durations.items(), ("total", self.total)]
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in metrics
+        )
+
+    def logFields(self):
+        metrics = [*self.durations.items(), ("total", self.total)]
+        return " ".join(f"{name}_ms={seconds * 1000:.1f}" for name, seconds in metrics)
+
+    def __switch(self):
+        now = time.perf_counter()
+        if self.__running:
+            name = self.__running[-1]
+            self.durations[name] = self.durations.get(name, 0) + now - self.__since
+        self.__since = now
+
+
+def startTimings():
+    """
+    Starts timing the stages run in the current context until `stopTimings`.
+    """
+    timings = Timings()
+    __timings.set(timings)
+    return timings
+
+
+def stopTimings():
+    __timings.set(None)
+
+
+def currentTimings():
+    return __timings.get()
+
+
+def count(name, value=1):
+    """
+    Adds `value` to the count `name` of the current request, if any.
+    """
+    timings = __timings.get()
+    if timings is not None:
+        timings.count(name, value)
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the block as the stage `name` of the current request, does nothing
+    outside of one, e.g. in job threads or sweep processes.
+    """
+    timings = __timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
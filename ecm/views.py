@@ -1,19 +1,101 @@
+import cProfile
+import io
 import json
-import pandas as pd
+import pstats
+import select
+import socket
+from sqlalchemy.exc import OperationalError
 from werkzeug.exceptions import BadRequest
-from .simulator import (
-    ModelContext,
-    Simulator,
-    SimulatorError,
-    modelExtendedLatex,
-    computeExtraColumns,
+from .simulator import BudgetExceeded, SimulatorError, modelCache
+from flask import (
+    Blueprint,
+    current_app,
+    g,
+    request,
+    send_from_directory,
+    Response,
+    send_file,
+    stream_with_context,
 )
-from flask import Blueprint, request, send_from_directory, Response, send_file
-from .models import Model
-from . import schemas
+from .metrics import metrics, timingSamples
+from .models import db, Model, ModelLatex, Simulation
+from .resultcache import resultCache
+from .store import (
+    findPreviousSimulation,
+    findSimulation,
+    resultStore,
+    saveSimulation,
+)
+from .timing import currentTimings, stage, startTimings, stopTimings
+from . import jobs, schemas, serializers
 
 bp = Blueprint("ecm", __name__, url_prefix="/")
 
+# lines of the cProfile summary returned with ?profile=1
+PROFILE_LINES = 40
+
+# endpoints serving files or the metrics themselves, they aren't recorded
+UNMETERED = {"ecm.home", "ecm.favicon", "ecm.serve_javascript", "ecm.metrics_report"}
+
+
+@bp.before_request
+def start_timings():
+    startTimings()
+    if current_app.config["PROFILE"] and request.args.get("profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@bp.after_request
+def add_timings(response):
+    """
+    Adds the time spent in each stage as a `Server-Timing` header, logs it
+    and records it in the metrics. With ?profile=1 the response is replaced
+    by a cProfile summary.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out).strip_dirs()
+        stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+        response = Response(out.getvalue(), mimetype="text/plain")
+
+    timings = currentTimings()
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.serverTiming()
+        if timings.durations:
+            current_app.logger.info(
+                f"method={request.method} path={request.path} "
+                f"status={response.status_code} {timings.logFields()}"
+            )
+        if request.endpoint not in UNMETERED:
+            __recordMetrics(timings, response)
+    return response
+
+
+def __recordMetrics(timings, response):
+    labels = {"endpoint": request.endpoint}
+    modelId = (request.view_args or {}).get("model_id")
+    if modelId is not None:
+        labels["model"] = modelId
+    counters, observations = timingSamples(timings, labels)
+    counters.append(
+        ("ecm_requests_total", {**labels, "status": response.status_code}, 1)
+    )
+    observations.append(("ecm_request_seconds", labels, timings.total))
+    size = response.calculate_content_length()
+    # streamed responses have no length
+    if size is not None:
+        observations.append(("ecm_response_bytes", labels, size))
+    metrics.record(counters, observations)
+
+
+@bp.teardown_request
+def stop_timings(exception):
+    # stages of a streamed response run after this, they aren't timed
+    stopTimings()
+
 
 @bp.route("/", methods=["GET"])
 def home():
@@ -37,20 +119,100 @@ def handle_error(error):
     return {"error": error.args[1]}, 400
 
 
+@bp.errorhandler(BudgetExceeded)
+def handle_budget_error(error):
+    return {"error": error.args[1], "estimate": error.estimate}, 422
+
+
 @bp.errorhandler(schemas.ValidationError)
 def handle_error(error):
     # flake8:noqa
     return {"error": "\n".join(e["msg"] for e in error.errors())}, 400
 
 
+def __storedLatex():
+    """
+    Latex stored for each model id, none when the database predates the
+    table, the models are rendered then.
+    """
+    try:
+        return {r.model: r.latex for r in ModelLatex.query.all()}
+    except OperationalError as e:
+        db.session.rollback()
+        current_app.logger.warning(f"stored latex unavailable error={e}")
+        return {}
+
+
 @bp.route("/api/models/", methods=["GET"])
 def list_models():
     models = Model.query.all()
+    rendered = __storedLatex()
     out = []
     for m in models:
-        obj = schemas.Model.from_orm(m)
-        out.append(modelExtendedLatex(obj))
-    return Response(json.dumps({"models": out}), mimetype="application/json")
+        if m.id in rendered:
+            out.append(rendered[m.id])
+        else:
+            from .simulator import modelExtendedLatex
+
+            obj = schemas.Model.from_orm(m)
+            out.append(modelExtendedLatex(obj))
+    response = Response(json.dumps({"models": out}), mimetype="application/json")
+    # browsers revalidate every time, answered with a 304 while nothing changed
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def __clientGone(connection):
+    """
+    Whether the client closed `connection` while its request is running.
+    """
+    try:
+        readable, _, _ = select.select([connection], [], [], 0)
+        return bool(readable) and not connection.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+
+
+def __requestBudget():
+    from .simulator import Budget
+
+    config = current_app.config
+    # only gunicorn hands the connection over
+    connection = request.environ.get("gunicorn.socket")
+    return Budget(
+        points=config["MAX_POINTS"],
+        work=config["MAX_WORK"],
+        rhsCalls=config["MAX_RHS_CALLS"],
+        seconds=config["MAX_SECONDS"],
+        cancelled=(lambda: __clientGone(connection)) if connection else None,
+    )
+
+
+def __simulate(model: schemas.Model, simulation: schemas.Simulation, stream):
+    # sympy and scipy are imported by the first simulation, not at startup
+    with stage("import"):
+        from .simulator import Simulator, computeExtraColumns
+
+    compiled = modelCache.get(model, current_app.config["ODE_BACKEND"])
+    sim = Simulator(
+        compiled.context,
+        compiled,
+        current_app.config["SWEEP_PROCESSES"],
+        budget=__requestBudget(),
+    )
+    # a stored run over less days only needs the days that are missing
+    with stage("store"):
+        previous = None if stream else findPreviousSimulation(model, simulation)
+        if previous is not None:
+            previous = resultStore.load(previous.id)
+    if previous is not None:
+        result = sim.extend(simulation, previous)
+    else:
+        result = sim.simulate(simulation, stream)
+    with stage("observables"):
+        computeExtraColumns(compiled.context, result, compiled.observables)
+    return result
 
 
 @bp.route("/simulate/<int:model_id>", methods=["POST"])
@@ -58,30 +220,148 @@ def simulate(model_id):
     data = request.json
     model = Model.query.get(model_id)
     modelSchema = schemas.Model.from_orm(model)
-    context = ModelContext(modelSchema)
-    sim = Simulator(context)
     if not data:
         raise BadRequest(description="No input data")
 
     simulationSchema = schemas.Simulation(**data)
-    response = {}
-
-    result = sim.simulate(simulationSchema)
-    computeExtraColumns(context, result)
-    if result.isIterated:
-        response["type"] = "multiple"
-        response["param"] = {"name": result.param, "values": list(result.paramValues)}
-        response["frames"] = []
-        for frame in result.frames:
-            df = pd.DataFrame(
-                data=frame, columns=result.compartments, index=result.timeline
-            )
-            response["frames"].append(df.transpose().to_dict(orient="split"))
-    else:
-        response["type"] = "simple"
-        df = pd.DataFrame(
-            data=result.frames[0], columns=result.compartments, index=result.timeline
+    mimetype = request.accept_mimetypes.best_match(
+        serializers.MIMETYPES, serializers.JSON
+    )
+    stream = mimetype == serializers.NDJSON
+    # a stream is only worth it while frames are being solved
+    cacheKey = (
+        None if stream else resultCache.key(modelSchema, simulationSchema, mimetype)
+    )
+    with stage("cache"):
+        body = resultCache.get(cacheKey) if cacheKey else None
+    if body is not None:
+        return Response(body, mimetype=mimetype, headers={"X-Cache": "HIT"})
+
+    with stage("store"):
+        run = None if stream else findSimulation(modelSchema, simulationSchema)
+        result = resultStore.load(run.id) if run is not None else None
+    if run is None:
+        result = __simulate(modelSchema, simulationSchema, stream)
+
+    if stream:
+        return Response(
+            stream_with_context(serializers.streamResult(result, simulationSchema)),
+            mimetype=mimetype,
         )
-        response["frame"] = df.transpose().to_dict(orient="split")
+    if run is None and __storable(simulationSchema, result):
+        with stage("save"):
+            run = saveSimulation(modelSchema, simulationSchema, result)
+    with stage("serialize"):
+        body = serializers.serializeResult(result, simulationSchema, mimetype)
+    with stage("cache"):
+        resultCache.set(cacheKey, body)
+    headers = {"X-Cache": "MISS"}
+    if run is not None:
+        headers["Content-Location"] = f"/api/jobs/{run.id}/result"
+    return Response(body, mimetype=mimetype, headers=headers)
+
+
+def __storable(simulation: schemas.Simulation, result):
+    """
+    Whether a /simulate run is worth storing, sweeps are answered with a
+    summary of many frames, too large to keep for a request.
+    """
+    if isinstance(simulation.iterate, schemas.Sweep):
+        return False
+    return len(result.frames) <= current_app.config["RESULT_STORE_MAX_FRAMES"]
+
+
+@bp.route("/sensitivity/<int:model_id>", methods=["POST"])
+def sensitivity(model_id):
+    """
+    The simulation in the body along with the sensitivity of every
+    compartment to every param, from a single solve of the forward
+    sensitivity equations, see `Simulator.sensitivity`.
+    """
+    data = request.json
+    model = Model.query.get(model_id)
+    if model is None:
+        return {"error": f"Unknown model {model_id}"}, 404
+    if not data:
+        raise BadRequest(description="No input data")
+
+    simulationSchema = schemas.Simulation(**data)
+    with stage("import"):
+        from .simulator import Simulator
+
+    compiled = modelCache.get(
+        schemas.Model.from_orm(model), current_app.config["ODE_BACKEND"]
+    )
+    sim = Simulator(compiled.context, compiled, budget=__requestBudget())
+    result = sim.sensitivity(simulationSchema)
+    with stage("serialize"):
+        body = serializers.dumpsJson(
+            serializers.sensitivityResponse(result, simulationSchema)
+        )
+    return Response(body, mimetype=serializers.JSON)
+
 
-    return Response(json.dumps(response), mimetype="application/json")
+@bp.route("/api/cache/", methods=["GET"])
+def cache_stats():
+    return Response(json.dumps(resultCache.report()), mimetype="application/json")
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_report():
+    return Response(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@bp.route("/api/jobs", methods=["POST"])
+def submit_job():
+    data = request.json
+    if not data or "simulation" not in data:
+        raise BadRequest(description="No input data")
+    model = Model.query.get(data.get("model"))
+    if model is None:
+        return {"error": f"Unknown model {data.get('model')}"}, 404
+
+    simulationSchema = schemas.Simulation(**data["simulation"])
+    job = jobs.submitJob(schemas.Model.from_orm(model), simulationSchema)
+    jobs.startWorkers(current_app._get_current_object())
+    return jobs.jobStatus(job), 202, {"Location": f"/api/jobs/{job.id}"}
+
+
+@bp.route("/api/jobs/<int:job_id>", methods=["GET"])
+def job_status(job_id):
+    job = Simulation.query.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job {job_id}"}, 404
+    return jobs.jobStatus(job)
+
+
+@bp.route("/api/jobs/<int:job_id>/result", methods=["GET"])
+def job_result(job_id):
+    """
+    The stored result of a job or of an earlier /simulate request, `start`
+    and `end` restrict it to the days in [start, end) and `max_points`
+    decimates it like in a /simulate request.
+    """
+    job = Simulation.query.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job {job_id}"}, 404
+    if job.status != jobs.DONE:
+        return jobs.jobStatus(job), 409
+
+    simulationSchema = jobs.jobSimulation(
+        job, max_points=request.args.get("max_points", type=int)
+    )
+    start = request.args.get("start", type=float)
+    end = request.args.get("end", type=float)
+    with stage("store"):
+        result = resultStore.load(job.id, start, end)
+    mimetype = request.accept_mimetypes.best_match(
+        serializers.MIMETYPES, serializers.JSON
+    )
+    if mimetype == serializers.NDJSON:
+        body = serializers.streamResult(result, simulationSchema)
+    else:
+        with stage("serialize"):
+            body = serializers.serializeResult(result, simulationSchema, mimetype)
+    return Response(body, mimetype=mimetype)
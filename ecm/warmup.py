@@ -0,0 +1,42 @@
+from sqlalchemy.exc import OperationalError
+from .models import db, Model, ModelLatex, store_model_latex
+from . import schemas
+
+
+def warmUp(app):
+    """
+    Does ahead of time what the first request to each model would: imports
+    sympy and scipy, compiles every stored model into the model cache and
+    renders the latex of models that don't have it stored. Run before
+    gunicorn forks (with `preload_app`) the workers share all of it. A
+    database error is logged and the warm up skipped, it never fails a boot.
+    """
+    # imported for the side effect, the first simulation doesn't pay for it
+    from .simulator import Simulator, SimulatorError, modelCache  # noqa: F401
+
+    with app.app_context():
+        try:
+            __warmUpModels(app)
+        except OperationalError as e:
+            # the workers still boot, the requests report the database
+            db.session.rollback()
+            app.logger.error(f"warmup skipped error={e}")
+        finally:
+            # forked workers can't share the connections
+            db.session.remove()
+            db.engine.dispose()
+    app.logger.info(f"warmup models={len(modelCache)}")
+
+
+def __warmUpModels(app):
+    from .simulator import SimulatorError, modelCache
+
+    rendered = {r.model for r in ModelLatex.query.all()}
+    for model in Model.query.all():
+        try:
+            modelCache.get(schemas.Model.from_orm(model), app.config["ODE_BACKEND"])
+        except SimulatorError as e:
+            app.logger.warning(f"model={model.id} warmup error={e.args[1]}")
+        if model.id not in rendered:
+            store_model_latex(db.session.connection(), model)
+    db.session.commit()
@@ -1,4 +1,8 @@
 from . import app
+from .warmup import warmUp
+
+if app.config["WARMUP"]:
+    warmUp(app)
 
 if __name__ == "__main__":
     app.run()
@@ -1,3 +1,5 @@
+import gc
+
 bind = "0.0.0.0:8000"
 workers = 4
 timeout = 30
@@ -5,3 +7,11 @@ error_logfile = "-"
 access_logfile = "/opt/logs/ecm-access.log"
 chdir = "/opt/ecm"
 pythonpath = "/opt/ecm/:/opt/venv/lib/:/opt/venv/lib/python3.8"
+# import the app, and warm it up, once in the master, workers get it through
+# fork and share the compiled models copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    # keep the garbage collector from touching, and copying, the shared objects
+    gc.freeze()
@@ -14,13 +14,15 @@ setup(
     packages=find_packages(),
     install_requires=[
         "flask",
-        "pandas",
         "scipy",
-        "matplotlib",
         "gunicorn",
         "sqlalchemy",
         "flask-sqlalchemy",
         "pydantic",
         "sympy",
     ],
+    extras_require={
+        # faster json encoding and the msgpack response format
+        "fast": ["orjson", "msgpack"],
+    },
 )
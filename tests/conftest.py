@@ -1,10 +1,26 @@
 import json
+import os
+import shutil
+import tempfile
 import pytest
 from pathlib import Path
-from ecm import app as ecm_app
 
 FIXTURE_DIR = Path(__file__).parent.parent / "fixture"
 
+# tests write jobs and results, keep them off the shipped database
+DATABASE = Path(tempfile.mkdtemp()) / "ecm-test.db"
+shutil.copy(Path(__file__).parent.parent / "ecm" / "ecm-fudepan.db", DATABASE)
+os.environ["ECM_DATABASE_URI"] = f"sqlite:///{DATABASE}"
+os.environ["ECM_RESULT_STORE_DIR"] = str(DATABASE.parent / "results")
+os.environ["ECM_METRICS_PATH"] = str(DATABASE.parent / "metrics.db")
+
+from ecm import app as ecm_app  # noqa: E402
+from ecm.cli import render_latex  # noqa: E402
+
+# the app upgraded the shipped database when created, it has no latex stored
+result = ecm_app.test_cli_runner().invoke(render_latex)
+assert result.exit_code == 0, result.output
+
 
 @pytest.fixture
 def simulation_schema():
@@ -1,3 +1,22 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+import json
+import io
+import numpy as np
+from pathlib import Path
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from ecm import jobs, schemas
+from ecm.models import db, Model, ModelLatex, Simulation, store_model_latex
+from ecm.resultcache import resultCache
+from ecm.store import resultStore, simulationColumns
+from ecm.simulator import modelCache, modelExtendedLatex
+from ecm.warmup import warmUp
+
+
 def test_simulate_endpoint(app):
     simSIR = {
         "step": 5,
@@ -14,3 +33,525 @@ def test_simulate_endpoint(app):
         response = client.post(url, json=simSIR, content_type=mimetype)
         assert response.json
         assert response.status_code == 200
+
+
+def test_simulate_endpoint_sweep_summary(app):
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999900, "I": 100, "R": 0},
+        "params": {"beta": 0.22, "gamma": 0.0714},
+        "iterate": {
+            "axes": [
+                {"key": "beta", "intervals": 3, "start": 0.1, "end": 0.3},
+                {"key": "gamma", "intervals": 2, "start": 0.05, "end": 0.1},
+            ],
+            "quantiles": [0.5],
+        },
+    }
+
+    with app.test_client() as client:
+        response = client.post("/simulate/1", json=simSIR)
+        assert response.status_code == 200
+        assert response.json["type"] == "summary"
+        assert response.json["params"]["names"] == ["beta", "gamma"]
+        assert len(response.json["params"]["values"]) == 6
+        assert response.json["mean"]["index"][:3] == ["S", "I", "R"]
+        assert response.json["quantiles"][0]["quantile"] == 0.5
+
+
+def test_simulate_endpoint_npz(app):
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999900, "I": 100, "R": 0},
+        "params": {"beta": 0.22, "gamma": 0.0714},
+    }
+
+    with app.test_client() as client:
+        response = client.post(
+            "/simulate/1", json=simSIR, headers={"Accept": "application/x-npz"}
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-npz"
+        archive = np.load(io.BytesIO(response.data))
+        assert archive["frames"].shape == (1, 10, 3)
+
+
+def test_simulate_endpoint_ndjson(app):
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999900, "I": 100, "R": 0},
+        "params": {"beta": 0.22, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 4, "start": 0.1, "end": 0.4},
+    }
+
+    with app.test_client() as client:
+        expected = client.post("/simulate/1", json=simSIR).json
+        response = client.post(
+            "/simulate/1", json=simSIR, headers={"Accept": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        header, *frames = [json.loads(line) for line in response.data.splitlines()]
+        assert header["type"] == "multiple"
+        assert header["param"] == expected["param"]
+        assert header["frames"] == 4
+        assert frames == expected["frames"]
+
+
+def test_simulate_endpoint_ndjson_budget(app):
+    simSIR = {
+        "step": 1,
+        "days": 3650,
+        "initial_conditions": {"S": 999900, "I": 100, "R": 0},
+        "params": {"beta": 0.22, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 4, "start": 0.1, "end": 0.4},
+    }
+
+    limit = app.config["MAX_RHS_CALLS"]
+    app.config["MAX_RHS_CALLS"] = 1
+    try:
+        with app.test_client() as client:
+            response = client.post(
+                "/simulate/1", json=simSIR, headers={"Accept": "application/x-ndjson"}
+            )
+    finally:
+        app.config["MAX_RHS_CALLS"] = limit
+
+    # the status went out before solving, the error is the last line
+    assert response.status_code == 200
+    header, *_, last = [json.loads(line) for line in response.data.splitlines()]
+    assert header["type"] == "multiple"
+    assert "evaluations" in last["error"]
+
+
+def test_list_models_etag(app):
+    with app.test_client() as client:
+        response = client.get("/api/models/")
+        assert response.status_code == 200
+        assert response.headers["ETag"]
+        assert len(response.json["models"]) > 0
+
+        cached = client.get(
+            "/api/models/", headers={"If-None-Match": response.headers["ETag"]}
+        )
+        assert cached.status_code == 304
+        assert cached.data == b""
+
+
+def test_list_models_stored_latex(app):
+    with app.app_context():
+        for model in Model.query.all():
+            stored = ModelLatex.query.get(model.id)
+            assert stored.latex == modelExtendedLatex(schemas.Model.from_orm(model))
+
+
+def test_list_models_without_latex_table(app):
+    with app.app_context():
+        ModelLatex.__table__.drop(db.engine)
+    try:
+        with app.test_client() as client:
+            response = client.get("/api/models/")
+    finally:
+        with app.app_context():
+            ModelLatex.__table__.create(db.engine)
+            for model in Model.query.all():
+                store_model_latex(db.session.connection(), model)
+            db.session.commit()
+
+    assert response.status_code == 200
+    with app.app_context():
+        models = [schemas.Model.from_orm(m) for m in Model.query.all()]
+    assert response.json["models"] == [modelExtendedLatex(m) for m in models]
+
+
+def test_simulate_endpoint_result_cache(app):
+    simSIR = {
+        "step": 1,
+        "days": 20,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        first = client.post("/simulate/1", json=simSIR)
+        second = client.post("/simulate/1", json=dict(reversed(simSIR.items())))
+        stats = client.get("/api/cache/").json
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.data == first.data
+    assert stats["hits"] >= 1
+
+
+def test_jobs_endpoint(app):
+    simSIR = {
+        "step": 1,
+        "days": 30,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 4, "start": 0.2, "end": 0.4},
+    }
+    with app.test_client() as client:
+        response = client.post("/api/jobs", json={"model": 1, "simulation": simSIR})
+        assert response.status_code == 202
+        url = response.headers["Location"]
+
+        for _ in range(100):
+            status = client.get(url).json
+            if status["status"] in ["done", "failed"]:
+                break
+            time.sleep(0.1)
+        result = client.get(f"{url}/result")
+        expected = client.post("/simulate/1", json=simSIR)
+
+    assert status["status"] == "done"
+    assert status["progress"] == 1
+    assert result.status_code == 200
+    assert result.json == expected.json
+
+
+def test_work_loop_survives_errors(app, monkeypatch):
+    stop = Event()
+    calls = []
+
+    def claimJob():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("database gone")
+        stop.set()
+
+    monkeypatch.setattr(jobs, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(jobs, "claimJob", claimJob)
+    jobs.workLoop(app, stop)
+
+    assert len(calls) == 2
+
+
+def test_workers_replace_ended_threads(app, monkeypatch):
+    ended = Thread(target=lambda: None)
+    ended.start()
+    ended.join()
+    stop = Event()
+    monkeypatch.setattr(jobs, "__workers", [ended])
+    monkeypatch.setattr(jobs, "workLoop", lambda app: stop.wait())
+    jobs.startWorkers(app)
+    workers = getattr(jobs, "__workers")
+    stop.set()
+
+    assert len(workers) == app.config["JOB_THREADS"]
+    assert ended not in workers
+
+
+def test_jobs_claim_lost_jobs(app):
+    simSIR = {
+        "step": 1,
+        "days": 30,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.31, "gamma": 0.0714},
+    }
+    with app.app_context():
+        model = schemas.Model.from_orm(Model.query.get(1))
+        columns = simulationColumns(model, schemas.Simulation(**simSIR))
+        started = datetime.utcnow() - timedelta(seconds=app.config["JOB_TIMEOUT"])
+        lost = Simulation(status=jobs.RUNNING, started=started, **columns)
+        running = Simulation(status=jobs.RUNNING, started=datetime.utcnow(), **columns)
+        db.session.add_all([lost, running])
+        db.session.commit()
+        lostId, runningId = lost.id, running.id
+    jobs.startWorkers(app)
+
+    with app.test_client() as client:
+        for _ in range(100):
+            status = client.get(f"/api/jobs/{lostId}").json
+            if status["status"] in ["done", "failed"]:
+                break
+            time.sleep(0.1)
+        other = client.get(f"/api/jobs/{runningId}").json
+    with app.app_context():
+        Simulation.query.filter_by(id=runningId).delete()
+        db.session.commit()
+
+    assert status["status"] == "done"
+    assert other["status"] == "running"
+
+
+def test_jobs_endpoint_errors(app):
+    simSIR = {
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.3},
+    }
+    with app.test_client() as client:
+        unknown = client.post("/api/jobs", json={"model": 999, "simulation": simSIR})
+        response = client.post("/api/jobs", json={"model": 1, "simulation": simSIR})
+        url = response.headers["Location"]
+        for _ in range(100):
+            status = client.get(url).json
+            if status["status"] in ["done", "failed"]:
+                break
+            time.sleep(0.1)
+        result = client.get(f"{url}/result")
+
+    assert unknown.status_code == 404
+    assert status["status"] == "failed"
+    assert status["error"] == "Missing parameter 'gamma'"
+    assert result.status_code == 409
+    assert client.get("/api/jobs/999999").status_code == 404
+
+
+def test_simulate_endpoint_stored_result(app):
+    simSIR = {
+        "step": 1,
+        "days": 40,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.35, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        response = client.post("/simulate/1", json=simSIR)
+        resultCache.clear()
+        again = client.post("/simulate/1", json=simSIR)
+        url = response.headers["Content-Location"]
+        stored = client.get(url).json
+        sliced = client.get(f"{url}?start=10&end=20").json
+
+    assert again.headers["Content-Location"] == url
+    assert stored == response.json
+    frame = response.json["frames"][0]
+    assert sliced["frames"][0]["columns"] == frame["columns"][10:20]
+    assert sliced["frames"][0]["data"] == [row[10:20] for row in frame["data"]]
+
+
+def test_simulate_endpoint_extends_stored_run(app):
+    simSIR = {
+        "step": 1,
+        "days": 60,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.25, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        short = client.post("/simulate/1", json=simSIR).json
+        simSIR["days"] = 90
+        extended = client.post("/simulate/1", json=simSIR).json
+
+    shortData = short["frames"][0]["data"]
+    extendedData = extended["frames"][0]["data"]
+    assert len(extended["frames"][0]["columns"]) == 90
+    assert [row[:60] for row in extendedData] == shortData
+
+
+def test_simulate_endpoint_store_eviction(app):
+    simSIR = {
+        "step": 1,
+        "days": 30,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.31, "gamma": 0.0714},
+    }
+    maxSize = resultStore.maxSize
+    with app.test_client() as client:
+        first = client.post("/simulate/1", json=simSIR)
+        runId = int(first.headers["Content-Location"].split("/")[3])
+        with app.app_context():
+            resultStore.maxSize = Simulation.query.get(runId).size
+        simSIR["params"]["beta"] = 0.32
+        try:
+            second = client.post("/simulate/1", json=simSIR)
+        finally:
+            resultStore.maxSize = maxSize
+        evicted = client.get(first.headers["Content-Location"])
+        kept = client.get(second.headers["Content-Location"])
+
+    assert evicted.status_code == 404
+    assert not (resultStore.path / str(runId)).exists()
+    assert kept.json == second.json
+
+
+def test_simulate_endpoint_sweep_not_stored(app):
+    simSIR = {
+        "step": 1,
+        "days": 30,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.33, "gamma": 0.0714},
+        "iterate": {
+            "sampler": "grid",
+            "axes": [{"key": "beta", "intervals": 3, "start": 0.2, "end": 0.4}],
+        },
+    }
+    with app.test_client() as client:
+        response = client.post("/simulate/1", json=simSIR)
+
+    assert response.status_code == 200
+    assert "Content-Location" not in response.headers
+
+
+def test_warmup_compiles_models(app):
+    modelCache.clear()
+    with app.app_context():
+        ModelLatex.query.filter_by(model=1).delete()
+        db.session.commit()
+        count = Model.query.count()
+
+    warmUp(app)
+    with app.app_context():
+        assert ModelLatex.query.get(1) is not None
+    assert len(modelCache) == count
+
+
+def test_simulate_endpoint_server_timing(app):
+    simSIR = {
+        "step": 1,
+        "days": 30,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.35, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        response = client.post("/simulate/1", json=simSIR)
+
+    stages = dict(
+        metric.split(";dur=")
+        for metric in response.headers["Server-Timing"].split(", ")
+    )
+    assert {"validate", "solve", "serialize", "total"} <= set(stages)
+    assert sum(float(d) for s, d in stages.items() if s != "total") <= float(
+        stages["total"]
+    )
+
+
+def test_simulate_endpoint_profile(app):
+    simSIR = {
+        "step": 1,
+        "days": 40,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.35, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        ignored = client.post("/simulate/1?profile=1", json=simSIR)
+        app.config["PROFILE"] = True
+        try:
+            profiled = client.post("/simulate/1?profile=1", json=simSIR)
+        finally:
+            app.config["PROFILE"] = False
+
+    assert ignored.mimetype == "application/json"
+    assert profiled.mimetype == "text/plain"
+    assert "cumulative" in profiled.get_data(as_text=True)
+
+
+def test_metrics_endpoint(app):
+    simSIR = {
+        "step": 1,
+        "days": 45,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.35, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 4, "start": 0.2, "end": 0.4},
+    }
+    with app.test_client() as client:
+        client.post("/simulate/1", json=simSIR)
+        client.get("/favicon.ico")
+        response = client.get("/metrics")
+
+    samples = dict(
+        line.rsplit(" ", 1)
+        for line in response.get_data(as_text=True).splitlines()
+        if not line.startswith("#")
+    )
+    labels = 'endpoint="ecm.simulate",model="1"'
+    assert response.mimetype == "text/plain"
+    assert float(samples[f'ecm_requests_total{{{labels},status="200"}}']) >= 1
+    assert float(samples[f"ecm_rhs_calls_total{{{labels}}}"]) > 0
+    assert float(samples[f"ecm_frames_total{{{labels}}}"]) >= 4
+    assert f'ecm_stage_seconds_count{{{labels},stage="solve"}}' in samples
+    assert not any("ecm.favicon" in sample for sample in samples)
+
+
+def test_simulate_endpoint_budget(app):
+    simSIR = {
+        "step": 0.001,
+        "days": 365,
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"beta": 0.35, "gamma": 0.0714},
+    }
+    with app.test_client() as client:
+        response = client.post("/simulate/1", json=simSIR)
+
+    assert response.status_code == 422
+    assert response.json["estimate"] == {"points": 365000, "frames": 1, "work": 365000}
+
+
+def test_sensitivity_endpoint(app):
+    simSIR = {
+        "step": 1,
+        "days": 100,
+        "initial_conditions": {"S": 999900, "I": 100, "R": 0},
+        "params": {"beta": 0.22, "gamma": 0.0714},
+        "max_points": 20,
+    }
+    with app.test_client() as client:
+        response = client.post("/sensitivity/1", json=simSIR)
+        iterated = client.post(
+            "/sensitivity/1",
+            json={
+                **simSIR,
+                "iterate": {"key": "beta", "intervals": 3, "start": 0.1, "end": 0.3},
+            },
+        )
+        unknown = client.post("/sensitivity/1000", json=simSIR)
+
+    assert response.status_code == 200
+    assert response.json["type"] == "sensitivity"
+    assert response.json["frame"]["index"] == ["S", "I", "R"]
+    assert len(response.json["frame"]["columns"]) == 20
+    sensitivities = {s["param"]: s["frame"] for s in response.json["sensitivities"]}
+    assert list(sensitivities) == ["beta", "gamma"]
+    assert sensitivities["beta"]["columns"] == response.json["frame"]["columns"]
+    # more infections the higher beta is, less the higher gamma is
+    assert max(sensitivities["beta"]["data"][1]) > 0
+    assert min(sensitivities["gamma"]["data"][1]) < 0
+    assert iterated.status_code == 400
+    assert iterated.json["error"] == "Sensitivities can't be iterated"
+    assert unknown.status_code == 404
+
+
+def runWsgi(script, tmp_path, database):
+    """
+    Output of `script` run after importing `ecm.wsgi` in a fresh interpreter
+    with `database`, the way a worker boots.
+    """
+    return subprocess.run(
+        [sys.executable, "-c", f"from ecm.wsgi import app\n{script}"],
+        env={
+            **os.environ,
+            "ECM_DATABASE_URI": f"sqlite:///{database}",
+            "ECM_RESULT_STORE_DIR": str(tmp_path / "results"),
+            "ECM_METRICS_PATH": str(tmp_path / "metrics.db"),
+            "ECM_WARMUP": "1",
+        },
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def test_boot_on_shipped_database(tmp_path):
+    # a fresh checkout, the shipped database was never upgraded by hand
+    database = tmp_path / "ecm.db"
+    shutil.copy(Path(__file__).parent.parent / "ecm" / "ecm-fudepan.db", database)
+    script = (
+        "client = app.test_client()\n"
+        "print('status', client.get('/api/models/').status_code)\n"
+        "simulation = {'initial_conditions': {'S': 999, 'I': 1, 'R': 0},"
+        " 'params': {'beta': 0.3, 'gamma': 0.07}, 'days': 30}\n"
+        "print('status', client.post('/simulate/1', json=simulation).status_code)\n"
+    )
+    output = runWsgi(script, tmp_path, database)
+
+    statuses = [line for line in output.splitlines() if line.startswith("status")]
+    assert statuses == ["status 200", "status 200"]
+
+
+def test_boot_without_database(tmp_path):
+    # the directory doesn't exist, sqlite can't open the database
+    output = runWsgi("print('booted')", tmp_path, tmp_path / "missing" / "ecm.db")
+
+    assert "warmup skipped" in output
+    assert output.splitlines()[-1] == "booted"
@@ -1,5 +1,15 @@
+import os
+import pickle
+import subprocess
+import sys
+import numpy as np
+from pathlib import Path
+from sympy import Symbol
 from ecm.schemas import Model, Simulation
 from ecm.simulator import (
+    Budget,
+    BudgetExceeded,
+    CompiledModel,
     ModelContext,
     Simulator,
     SimulatorError,
@@ -7,7 +17,7 @@ from ecm.simulator import (
     computeExtraColumns,
 )
 
-from pytest import approx, raises
+from pytest import approx, mark, raises
 
 
 def test_sim_basic(simulation_schema):
@@ -135,7 +145,7 @@ def test_sim_model_cannot_solve_symbols(simulation_schema):
     sim = Simulator(context)
     with raises(SimulatorError) as e:
         sim.simulate(simulation)
-    assert e.value.args[1] == "Deep recursion exceeded unfolding expressions."
+    assert e.value.args[1] == "Cyclic expressions: N -> S -> N"
 
 
 def test_sim_model_cannot_solve_preconditions(simulation_schema):
@@ -159,6 +169,25 @@ def test_sim_model_cannot_solve_preconditions(simulation_schema):
     )
 
 
+def test_sim_model_precondition_not_a_predicate(simulation_schema):
+    modelData = simulation_schema("models/SIR.json")
+    modelData["preconditions"] = [{"predicate": "beta - gamma"}]
+
+    model = Model(**modelData)
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.1},
+    }
+    sim = Simulator(ModelContext(model))
+    with raises(SimulatorError) as e:
+        sim.simulate(Simulation(**simSIR))
+    assert (
+        e.value.args[1] == "Cannot solve precondition [beta - gamma]: 0.200000000000000"
+    )
+
+
 def test_sim_precondition_error_1(simulation_schema):
     model = Model(**simulation_schema("models/SIR.json"))
     simSIR = {
@@ -231,3 +260,553 @@ def test_process_observables(simulation_schema):
     result = sim.simulate(simulation)
     computeExtraColumns(context, result)
     assert True
+
+
+@mark.parametrize(
+    "filename", ["models/SIR.json", "models/SEIR-HL.json", "models/SEIR-5G.json"]
+)
+def test_numpy_backend_parity(simulation_schema, filename):
+    model = Model(**simulation_schema(filename))
+    initialConditions = {c.name: c.default for c in model.compartments}
+    # move some susceptible population to infected so the dynamics are not flat
+    susceptible = model.compartments[0].name
+    initialConditions[susceptible] -= 0.01
+    initialConditions["I" + susceptible[1:]] += 0.01
+    simulation = Simulation(
+        step=1,
+        days=100,
+        initial_conditions=initialConditions,
+        params={p.name: p.default for p in model.params},
+    )
+
+    results = [
+        Simulator(context, CompiledModel(context, backend)).simulate(simulation)
+        for context, backend in [
+            (ModelContext(model), "python"),
+            (ModelContext(model), "numpy"),
+        ]
+    ]
+    assert results[0].frames[0] == approx(results[1].frames[0], rel=1e-6)
+
+
+@mark.parametrize(
+    "filename", ["models/SIR.json", "models/SEIR-HL.json", "models/SEIR-5G.json"]
+)
+def test_native_backend_parity(simulation_schema, filename, tmp_path, monkeypatch):
+    monkeypatch.setenv("ECM_NATIVE_CACHE_DIR", str(tmp_path))
+    model = Model(**simulation_schema(filename))
+    numpy, native = (CompiledModel(ModelContext(model), b) for b in ["numpy", "native"])
+    z = np.array([c.default for c in model.compartments]) + 100
+    args = [0.5] * len(numpy.variables)
+
+    assert len(list(tmp_path.iterdir())) == 1
+    assert native.odeModel(z, 1.0, *native.odeArgs(args)) == approx(
+        numpy.odeModel(z, 1.0, *numpy.odeArgs(args))
+    )
+    assert native.odeJacobian(z, 1.0, *native.odeArgs(args)) == approx(
+        numpy.odeJacobian(z, 1.0, *numpy.odeArgs(args))
+    )
+    # the sweep processes load it from the cache
+    restored = pickle.loads(pickle.dumps(native))
+    assert restored.odeModel is native.odeModel
+
+
+def test_native_source_is_reproducible(simulation_schema):
+    # the cache is shared between processes, each with its own hash seed
+    script = (
+        "import json, sys\n"
+        "from ecm.schemas import Model\n"
+        "from ecm.simulator import ModelContext\n"
+        "from ecm.simulator.native import moduleSource\n"
+        "model = Model(**json.load(open(sys.argv[1])))\n"
+        "print(moduleSource(ModelContext(model), 'm'))\n"
+    )
+    path = Path(__file__).parent.parent / "fixture" / "models" / "SEIR-5G.json"
+    sources = {
+        subprocess.run(
+            [sys.executable, "-c", script, str(path)],
+            env={**os.environ, "PYTHONHASHSEED": str(seed)},
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        for seed in range(1, 4)
+    }
+    assert len(sources) == 1
+
+
+def test_native_backend_fallback(simulation_schema, tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("ECM_NATIVE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("CC", str(tmp_path / "missing-cc"))
+    # a model no other test compiles natively, so it isn't loaded already
+    model = Model(**simulation_schema("models/SIR-alpha.json"))
+    simulation = Simulation(
+        step=5,
+        days=50,
+        initial_conditions={c.name: c.default for c in model.compartments},
+        params={p.name: p.default for p in model.params},
+    )
+    context = ModelContext(model)
+    expected = Simulator(context).simulate(simulation)
+    compiled = CompiledModel(context, "native")
+    result = Simulator(context, compiled).simulate(simulation)
+
+    assert "Native ode backend unavailable" in caplog.text
+    assert not list(tmp_path.iterdir())
+    assert result.frames[0] == approx(expected.frames[0])
+
+
+@mark.parametrize("solver", [None, {"method": "BDF", "rtol": 1e-8, "atol": 1e-6}])
+def test_sensitivity_matches_finite_differences(simulation_schema, solver):
+    model = Model(**simulation_schema("models/SEIR-HL.json"))
+    initialConditions = {c.name: c.default for c in model.compartments}
+    initialConditions["Sl"] -= 0.01
+    initialConditions["Il"] += 0.01
+    params = {p.name: p.default for p in model.params}
+
+    def simulation(**changed):
+        return Simulation(
+            step=1,
+            days=100,
+            initial_conditions=initialConditions,
+            params={**params, **changed},
+            solver=solver,
+        )
+
+    simulator = Simulator(ModelContext(model))
+    result = simulator.sensitivity(simulation())
+    assert result.frames[0] == approx(simulator.simulate(simulation()).frames[0])
+    assert list(result.sensitivities) == list(params)
+    for param in ["p", "gamma", "H"]:
+        h = params[param] * 1e-4
+        up = simulator.simulate(simulation(**{param: params[param] + h}))
+        down = simulator.simulate(simulation(**{param: params[param] - h}))
+        expected = (up.frames[0] - down.frames[0]) / (2 * h)
+        assert result.sensitivities[param] == approx(
+            expected, rel=1e-3, abs=np.abs(expected).max() * 1e-5
+        )
+
+
+def test_native_backend_unsafe_cache(simulation_schema, tmp_path, monkeypatch, caplog):
+    cache = tmp_path / "cache"
+    cache.mkdir(mode=0o777)
+    cache.chmod(0o777)
+    monkeypatch.setenv("ECM_NATIVE_CACHE_DIR", str(cache))
+    model = Model(**simulation_schema("models/SIR-HL.json"))
+    compiled = CompiledModel(ModelContext(model), "native")
+
+    assert "writable by other users" in caplog.text
+    assert not list(cache.iterdir())
+    assert compiled.odeModel.__name__ == "ode_model"
+
+
+def test_native_backend_broken_cache(simulation_schema, tmp_path):
+    # libraries are loaded once per process, load the broken one in a new one
+    script = (
+        "import json, logging, sys\n"
+        "from ecm.schemas import Model\n"
+        "from ecm.simulator import CompiledModel, ModelContext\n"
+        "logging.basicConfig()\n"
+        "model = Model(**json.load(open(sys.argv[1])))\n"
+        "compiled = CompiledModel(ModelContext(model), 'native')\n"
+        "print(compiled.odeModel.__module__)\n"
+    )
+    path = Path(__file__).parent.parent / "fixture" / "models" / "SIR.json"
+
+    def run():
+        return subprocess.run(
+            [sys.executable, "-c", script, str(path)],
+            env={**os.environ, "ECM_NATIVE_CACHE_DIR": str(tmp_path)},
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+
+    assert run().stdout.startswith("ecm_native_")
+    for library in tmp_path.iterdir():
+        library.write_bytes(b"not a library")
+    fallback = run()
+
+    assert "Native ode backend unavailable" in fallback.stderr
+    assert not fallback.stdout.startswith("ecm_native_")
+
+
+def test_jacobian_matches_finite_differences(simulation_schema):
+    model = Model(**simulation_schema("models/SEIR-HL.json"))
+    compiled = CompiledModel(ModelContext(model))
+    z = np.array([c.default for c in model.compartments]) + 100
+    args = compiled.odeArgs([0.5] * len(compiled.variables))
+    jacobian = compiled.odeJacobian(z, 0, *args).copy()
+
+    for j in range(len(z)):
+        dz = np.zeros(len(z))
+        dz[j] = 1e-3
+        up = np.array(compiled.odeModel(z + dz, 0, *args))
+        down = np.array(compiled.odeModel(z - dz, 0, *args))
+        assert jacobian[:, j] == approx((up - down) / 2e-3, rel=1e-4, abs=1e-6)
+
+
+@mark.parametrize("method", ["LSODA", "BDF", "Radau", "RK45"])
+def test_solver_methods(simulation_schema, method):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+    }
+    expected = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+
+    simSIR["solver"] = {"method": method, "rtol": 1e-8, "atol": 1e-6}
+    result = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+    assert result.frames[0] == approx(expected.frames[0], rel=1e-4, abs=1e-2)
+
+
+def test_sim_parallel_sweep(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 10, "start": 0, "end": 1},
+    }
+    expected = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+    result = Simulator(ModelContext(model), processes=3).simulate(Simulation(**simSIR))
+
+    assert result.param == "beta"
+    assert list(result.paramValues) == list(expected.paramValues)
+    assert len(result.frames) == 10
+    for frame, expectedFrame in zip(result.frames, expected.frames):
+        assert frame == approx(expectedFrame)
+
+
+def test_compiled_model_pickle(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    compiled = CompiledModel(ModelContext(model))
+    restored = pickle.loads(pickle.dumps(compiled))
+    z = np.array([999600.0, 400.0, 0.0])
+    args = compiled.odeArgs([0.5] * len(compiled.variables))
+
+    assert restored.backend == compiled.backend
+    assert np.array(restored.odeModel(z, 0, *args)) == approx(
+        np.array(compiled.odeModel(z, 0, *args))
+    )
+
+
+@mark.parametrize(
+    "solver",
+    [None, {"method": "BDF", "rtol": 1e-8}, {"method": "RK45", "rtol": 1e-8}],
+)
+def test_sim_ensemble_sweep(simulation_schema, solver):
+    model = Model(**simulation_schema("models/SEIR-HL.json"))
+    simulation = {
+        "step": 1,
+        "days": 200,
+        "initial_conditions": {c.name: c.default for c in model.compartments},
+        "params": {p.name: p.default for p in model.params},
+        "iterate": {"key": "p", "intervals": 8, "start": 0.1, "end": 0.9},
+        "solver": solver,
+    }
+    expected = Simulator(ModelContext(model)).simulate(Simulation(**simulation))
+    simulation["iterate"]["ensemble"] = True
+    result = Simulator(ModelContext(model)).simulate(Simulation(**simulation))
+
+    assert len(result.frames) == 8
+    for frame, expectedFrame in zip(result.frames, expected.frames):
+        assert frame.shape == expectedFrame.shape
+        assert frame == approx(expectedFrame, rel=1e-2, abs=1)
+
+
+def test_sim_sweep_grid(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": {
+            "axes": [
+                {"key": "beta", "intervals": 3, "start": 0.5, "end": 1},
+                {"key": "gamma", "space": "values", "values": [0.05, 0.1]},
+            ],
+        },
+    }
+    result = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+
+    assert result.param == ["beta", "gamma"]
+    assert result.paramValues.tolist() == [
+        [0.5, 0.05],
+        [0.5, 0.1],
+        [0.75, 0.05],
+        [0.75, 0.1],
+        [1, 0.05],
+        [1, 0.1],
+    ]
+    assert len(result.frames) == 6
+
+    simSIR["params"].update({"beta": 0.75, "gamma": 0.1})
+    del simSIR["iterate"]
+    expected = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+    assert result.frames[3] == approx(expected.frames[0], rel=1e-3, abs=1)
+
+
+def test_sim_sweep_lhs_summary(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": {
+            "axes": [
+                {"key": "beta", "start": 0.5, "end": 1},
+                {"key": "gamma", "space": "logspace", "start": 0.01, "end": 0.1},
+            ],
+            "sampler": "lhs",
+            "samples": 100,
+            "seed": 7,
+            "quantiles": [0.1, 0.9],
+        },
+    }
+    result = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+    again = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+
+    assert result.paramValues.shape == (100, 2)
+    assert result.paramValues.tolist() == again.paramValues.tolist()
+    assert all(0.5 <= beta <= 1 for beta in result.paramValues[:, 0])
+    assert all(0.01 <= gamma <= 0.1 for gamma in result.paramValues[:, 1])
+
+    mean, quantiles = result.summary([0.1, 0.9])
+    assert mean.shape == (10, 3)
+    assert quantiles.shape == (2, 10, 3)
+    assert (quantiles[0] <= quantiles[1]).all()
+
+
+def test_process_observables_environment(simulation_schema):
+    modelData = simulation_schema("models/SIR.json")
+    modelData["observables"] = [
+        {"name": "Rt", "value": "beta * S / (N * gamma)"},
+        {"name": "Day", "value": "t"},
+        {"name": "Total", "value": "S + I + R"},
+    ]
+    model = Model(**modelData)
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0, "gamma": 0.1},
+        "iterate": {"key": "beta", "intervals": 3, "start": 0.1, "end": 0.3},
+    }
+    context = ModelContext(model)
+    result = Simulator(context).simulate(Simulation(**simSIR))
+    computeExtraColumns(context, result)
+
+    assert result.compartments == ["S", "I", "R", "Rt", "Day", "Total"]
+    for frame, beta in zip(result.frames, [0.1, 0.2, 0.3]):
+        assert frame.shape == (10, 6)
+        assert frame[:, 3] == approx(beta * frame[:, 0] / (1e6 * 0.1))
+        assert frame[:, 4] == approx(result.timeline)
+        assert frame[:, 5] == approx(np.full(10, 1e6))
+
+
+def test_sim_stream_frames(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 3, "start": 0.1, "end": 0.3},
+    }
+    expected = Simulator(ModelContext(model)).simulate(Simulation(**simSIR))
+    result = Simulator(ModelContext(model)).simulate(Simulation(**simSIR), stream=True)
+
+    assert not isinstance(result.frames, list)
+    assert len(result.params) == 3
+    frames = list(result.frames)
+    assert len(frames) == 3
+    for frame, expectedFrame in zip(frames, expected.frames):
+        assert frame == approx(expectedFrame)
+
+
+@mark.parametrize(
+    "iterate",
+    [
+        {"key": "beta", "intervals": 3, "start": 0.5, "end": 1},
+        {"axes": [{"key": "beta", "intervals": 70, "start": 0.5, "end": 1}]},
+    ],
+)
+def test_sim_progress(simulation_schema, iterate):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": iterate,
+    }
+    calls = []
+    sim = Simulator(ModelContext(model), progress=lambda *args: calls.append(args))
+    result = sim.simulate(Simulation(**simSIR))
+
+    assert calls[-1] == (len(result.frames), len(result.frames))
+    assert [done for done, _ in calls] == sorted(done for done, _ in calls)
+
+
+@mark.parametrize(
+    "iterate",
+    [
+        None,
+        {"key": "beta", "intervals": 3, "start": 0.5, "end": 1},
+        {"key": "beta", "intervals": 3, "start": 0.5, "end": 1, "ensemble": True},
+        {"axes": [{"key": "beta", "intervals": 70, "start": 0.5, "end": 1}]},
+    ],
+)
+def test_sim_extend(simulation_schema, iterate):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 0.5,
+        "days": 100,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": iterate,
+    }
+    sim = Simulator(ModelContext(model))
+    previous = sim.simulate(Simulation(**simSIR))
+    simSIR["days"] = 130
+    expected = sim.simulate(Simulation(**simSIR))
+    result = sim.extend(Simulation(**simSIR), previous)
+
+    assert result.timeline.tolist() == expected.timeline.tolist()
+    assert result.params == expected.params
+    assert len(result.frames) == len(expected.frames)
+    for frame, previousFrame, expectedFrame in zip(
+        result.frames, previous.frames, expected.frames
+    ):
+        assert np.array_equal(frame[: len(previous.timeline)], previousFrame)
+        assert frame == approx(expectedFrame, rel=1e-3, abs=1)
+
+
+def test_sim_extend_different_timeline(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 1,
+        "days": 100,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+    }
+    sim = Simulator(ModelContext(model))
+    previous = sim.simulate(Simulation(**simSIR))
+    simSIR.update({"step": 0.5, "days": 130})
+
+    with raises(SimulatorError) as e:
+        sim.extend(Simulation(**simSIR), previous)
+    assert e.value.args[1] == "Cannot extend a different timeline"
+
+
+@mark.parametrize(
+    "filename", ["models/SIR.json", "models/SEIR-HL.json", "models/SEIR-5G.json"]
+)
+def test_numeric_preconditions_and_variables(simulation_schema, filename):
+    model = Model(**simulation_schema(filename))
+    context = ModelContext(model)
+    compiled = CompiledModel(context)
+    rng = np.random.default_rng(0)
+    symbols = {
+        **{Symbol(p): rng.uniform(-0.2, 1) for p in context.params},
+        **{Symbol(f"{c}_0"): float(rng.integers(0, 3)) for c in context.compartments},
+    }
+    values = list(symbols.values())
+    params, initialConditions = np.split(values, [len(context.params)])
+
+    holds = compiled.preconditionValues(params, initialConditions)
+    for idx, predExpr in enumerate(compiled.preconditions.values()):
+        assert bool(holds[idx]) == bool(predExpr.subs(symbols))
+    assert compiled.variableValues(params, initialConditions) == approx(
+        [float(v.subs(symbols)) for v in compiled.variables]
+    )
+
+
+def test_unfold_expressions_dependency_order(simulation_schema):
+    modelData = simulation_schema("models/SIR.json")
+    modelData["expressions"] = [
+        {"name": "C", "value": "B * 2"},
+        {"name": "B", "value": "A + N"},
+        {"name": "A", "value": "beta * N"},
+        {"name": "N", "value": "S_0 + I_0 + R_0"},
+    ]
+    context = ModelContext(Model(**modelData))
+    written = dict(context.expressions)
+    unfolded = context.unfoldedExpressions
+
+    N = Symbol("S_0") + Symbol("I_0") + Symbol("R_0")
+    assert list(unfolded) == ["C", "B", "A", "N"]
+    assert unfolded["C"] == 2 * (Symbol("beta") * N + N)
+    assert context.expressions == written
+
+
+def test_unfold_expressions_reports_cycle(simulation_schema):
+    modelData = simulation_schema("models/SIR.json")
+    modelData["expressions"] = [
+        {"name": "N", "value": "S_0 + I_0 + R_0"},
+        {"name": "A", "value": "B + N"},
+        {"name": "B", "value": "C * 2"},
+        {"name": "C", "value": "A - 1"},
+    ]
+    with raises(SimulatorError) as e:
+        ModelContext(Model(**modelData)).unfoldedExpressions
+    assert e.value.args[1] == "Cyclic expressions: A -> B -> C -> A"
+
+
+@mark.parametrize(
+    "simulation, message",
+    [
+        ({"step": 0.001}, "1 frames of 365000 points"),
+        (
+            {
+                "iterate": {
+                    "axes": [{"key": "beta", "intervals": 200, "start": 0, "end": 1}]
+                }
+            },
+            "200 frames of 365 points",
+        ),
+    ],
+)
+def test_sim_budget_rejects_large_simulations(simulation_schema, simulation, message):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 1,
+        "days": 365,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.0714},
+        **simulation,
+    }
+    sim = Simulator(ModelContext(model), budget=Budget(points=100000, work=50000))
+    with raises(BudgetExceeded) as e:
+        sim.simulate(Simulation(**simSIR))
+    assert message in e.value.args[1]
+    assert e.value.estimate["work"] > 50000
+
+
+@mark.parametrize(
+    "budget, processes",
+    [
+        (Budget(rhsCalls=1000), 1),
+        (Budget(rhsCalls=1000), 2),
+        (Budget(seconds=1e-9), 1),
+        (Budget(cancelled=lambda: True), 1),
+    ],
+)
+def test_sim_budget_stops_solver(simulation_schema, budget, processes):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 1,
+        "days": 365,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 20, "start": 0.1, "end": 1},
+    }
+    sim = Simulator(ModelContext(model), processes=processes, budget=budget)
+    with raises(BudgetExceeded):
+        sim.simulate(Simulation(**simSIR))
@@ -0,0 +1,92 @@
+import json
+from flask import Flask
+from ecm.schemas import Model, Simulation
+from ecm.resultcache import ResultCache
+from ecm.simulator import ModelCache, modelHash
+
+SIMULATION = {
+    "step": 1,
+    "days": 10,
+    "initial_conditions": {"S": 999, "I": 1, "R": 0},
+    "params": {"beta": 0.22, "gamma": 0.0714},
+}
+
+
+def test_cache_reuses_compiled_model(simulation_schema):
+    cache = ModelCache()
+    model = Model(**simulation_schema("models/SIR.json"), id=1)
+
+    compiled = cache.get(model)
+    assert cache.get(Model(**simulation_schema("models/SIR.json"), id=1)) is compiled
+    assert len(cache) == 1
+
+
+def test_cache_key_includes_definition(simulation_schema):
+    cache = ModelCache()
+    modelData = simulation_schema("models/SIR.json")
+    model = Model(**modelData, id=1)
+    modelData["params"][0]["default"] = 2
+    edited = Model(**modelData, id=1)
+
+    assert modelHash(model) != modelHash(edited)
+    assert cache.get(model) is not cache.get(edited)
+
+
+def test_cache_lru_eviction(simulation_schema):
+    cache = ModelCache(maxsize=2)
+    models = [Model(**simulation_schema("models/SIR.json"), id=i) for i in range(1, 4)]
+    first = cache.get(models[0])
+    cache.get(models[1])
+    cache.get(models[0])
+    cache.get(models[2])
+
+    assert len(cache) == 2
+    assert cache.get(models[0]) is first
+
+
+def test_cache_invalidate(simulation_schema):
+    cache = ModelCache()
+    model = Model(**simulation_schema("models/SIR.json"), id=1)
+    compiled = cache.get(model)
+    cache.invalidate(1)
+
+    assert len(cache) == 0
+    assert cache.get(model) is not compiled
+
+
+def test_result_cache_hit_and_lru(simulation_schema):
+    cache = ResultCache(maxsize=10)
+    model = Model(**simulation_schema("models/SIR.json"), id=1)
+    simulation = Simulation(**SIMULATION)
+    key = cache.key(model, simulation, "application/json")
+
+    assert cache.get(key) is None
+    cache.set(key, b"12345")
+    cache.set("other", b"123456")
+    assert cache.get(key) is None
+    assert cache.get("other") == b"123456"
+    assert cache.report()["hits"] == 1
+    assert cache.report()["misses"] == 2
+
+
+def test_result_cache_key_normalizes_simulation(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"), id=1)
+    data = json.loads(json.dumps(SIMULATION))
+    key = ResultCache.key(model, Simulation(**data), "application/json")
+    data["params"] = dict(reversed(list(data["params"].items())))
+
+    assert ResultCache.key(model, Simulation(**data), "application/json") == key
+    assert ResultCache.key(model, Simulation(**data), "application/x-npz") != key
+
+
+def test_result_cache_disk_tier(tmp_path):
+    path = str(tmp_path / "results.db")
+    first, second = ResultCache(path=path), ResultCache(path=path)
+    for cache in (first, second):
+        cache.init_app(Flask(__name__))
+    first.set("key", b"body")
+
+    assert second.get("key") == b"body"
+    assert second.report()["diskHits"] == 1
+    assert second.get("key") == b"body"
+    assert second.report()["hits"] == 1
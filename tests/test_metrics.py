@@ -0,0 +1,57 @@
+from multiprocessing import Pool
+from flask import Flask
+from ecm.metrics import Metrics
+
+
+def metricsAt(path):
+    app = Flask(__name__)
+    app.config["METRICS_PATH"] = str(path)
+    metrics = Metrics()
+    metrics.init_app(app)
+    return metrics
+
+
+def recordRequest(path):
+    metricsAt(path).record(
+        [("ecm_requests_total", {"endpoint": "ecm.simulate", "model": 1}, 1)],
+        [("ecm_request_seconds", {"endpoint": "ecm.simulate"}, 0.02)],
+    )
+
+
+def test_metrics_histogram(tmp_path):
+    metrics = metricsAt(tmp_path / "metrics.db")
+    for seconds in [0.002, 0.02, 2]:
+        metrics.record(
+            observations=[("ecm_request_seconds", {"endpoint": "a"}, seconds)]
+        )
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE ecm_request_seconds histogram" in lines
+    buckets = [line for line in lines if line.startswith("ecm_request_seconds_bucket")]
+    assert buckets[0] == 'ecm_request_seconds_bucket{endpoint="a",le="0.001"} 0'
+    assert 'ecm_request_seconds_bucket{endpoint="a",le="0.05"} 2' in buckets
+    assert buckets[-1] == 'ecm_request_seconds_bucket{endpoint="a",le="+Inf"} 3'
+    assert 'ecm_request_seconds_sum{endpoint="a"} 2.022' in lines
+    assert 'ecm_request_seconds_count{endpoint="a"} 3' in lines
+
+
+def test_metrics_large_counter(tmp_path):
+    metrics = metricsAt(tmp_path / "metrics.db")
+    metrics.record([("ecm_rhs_calls_total", {}, 1234567)])
+    metrics.record([("ecm_rhs_calls_total", {}, 3)])
+    metrics.record(observations=[("ecm_request_seconds", {}, 1234567.125)])
+
+    lines = metrics.render().splitlines()
+    assert "ecm_rhs_calls_total 1234570" in lines
+    assert "ecm_request_seconds_sum 1234567.125" in lines
+
+
+def test_metrics_shared_by_processes(tmp_path):
+    path = tmp_path / "metrics.db"
+    metricsAt(path)
+    with Pool(4) as pool:
+        pool.map(recordRequest, [path] * 20)
+    lines = metricsAt(path).render().splitlines()
+
+    assert 'ecm_requests_total{endpoint="ecm.simulate",model="1"} 20' in lines
+    assert 'ecm_request_seconds_count{endpoint="ecm.simulate"} 20' in lines
@@ -58,3 +58,67 @@ def test_schema_simulation_iterate_interval_negative():
     }
     with raises(ValidationError):
         Simulation(**simSIR)
+
+
+def test_schema_simulation_invalid_solver():
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "solver": {"method": "Euler"},
+    }
+    with raises(ValidationError):
+        Simulation(**simSIR)
+
+
+def test_schema_simulation_invalid_tolerance():
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "solver": {"method": "BDF", "rtol": 0},
+    }
+    with raises(ValidationError):
+        Simulation(**simSIR)
+
+
+def test_schema_simulation_sweep_lhs_values():
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": {
+            "axes": [{"key": "beta", "space": "values", "values": [0, 1]}],
+            "sampler": "lhs",
+            "samples": 10,
+        },
+    }
+    with raises(ValidationError):
+        Simulation(**simSIR)
+
+
+def test_schema_simulation_sweep_grid_intervals():
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "iterate": {"axes": [{"key": "beta", "start": 0, "end": 1}]},
+    }
+    with raises(ValidationError):
+        Simulation(**simSIR)
+
+
+def test_schema_simulation_invalid_max_points():
+    simSIR = {
+        "step": 5,
+        "days": 50,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 1, "gamma": 0.0714},
+        "max_points": 2,
+    }
+    with raises(ValidationError):
+        Simulation(**simSIR)
@@ -0,0 +1,119 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+from ecm import serializers
+from ecm.schemas import Model, Simulation
+from ecm.simulator import ModelContext, Simulator, computeExtraColumns
+from ecm.simulator.downsample import lttbIndices
+
+from pytest import approx, importorskip
+
+simSIR = {
+    "step": 5,
+    "days": 50,
+    "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+    "params": {"beta": 0, "gamma": 0.0714},
+    "iterate": {"key": "beta", "intervals": 3, "start": 0.1, "end": 0.3},
+}
+
+
+def simulate(simulation_schema, simulation):
+    model = Model(**simulation_schema("models/SIR-HL.json"))
+    context = ModelContext(model)
+    result = Simulator(context).simulate(simulation)
+    computeExtraColumns(context, result)
+    return result
+
+
+def test_json_matches_pandas_split(simulation_schema):
+    simulation = Simulation(
+        step=1,
+        days=30,
+        initial_conditions={
+            "Sl": 599800,
+            "Sh": 399800,
+            "Il": 200,
+            "Ih": 200,
+            "Rl": 0,
+            "Rh": 0,
+        },
+        params={
+            "p": 0.1818,
+            "gamma": 0.0714,
+            "H": 10,
+            "L": 1,
+            "Noh": 400000,
+            "Nol": 600000,
+        },
+        iterate={"key": "p", "intervals": 3, "start": 0.1, "end": 0.3},
+    )
+    result = simulate(simulation_schema, simulation)
+    response = json.loads(serializers.serializeResult(result, simulation))
+
+    assert response["type"] == "multiple"
+    assert response["param"]["name"] == "p"
+    assert response["param"]["values"] == approx([0.1, 0.2, 0.3])
+    for frame, expected in zip(response["frames"], result.frames):
+        df = pd.DataFrame(
+            data=expected, columns=result.compartments, index=result.timeline
+        )
+        assert frame == df.transpose().to_dict(orient="split")
+
+
+def test_npz_frames(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simulation = Simulation(**simSIR)
+    result = Simulator(ModelContext(model)).simulate(simulation)
+    archive = np.load(
+        io.BytesIO(serializers.serializeResult(result, simulation, serializers.NPZ))
+    )
+
+    assert archive["compartments"].tolist() == ["S", "I", "R"]
+    assert archive["param"].item() == "beta"
+    assert archive["frames"].shape == (3, 10, 3)
+    assert archive["frames"][1] == approx(result.frames[1])
+
+
+def test_msgpack_matches_json(simulation_schema):
+    msgpack = importorskip("msgpack")
+    model = Model(**simulation_schema("models/SIR.json"))
+    simulation = Simulation(**simSIR)
+    result = Simulator(ModelContext(model)).simulate(simulation)
+
+    packed = msgpack.unpackb(
+        serializers.serializeResult(result, simulation, serializers.MSGPACK)
+    )
+    assert packed == json.loads(serializers.serializeResult(result, simulation))
+
+
+def test_lttb_keeps_peaks():
+    timeline = np.arange(1000.0)
+    series = np.column_stack(
+        [np.exp(-(((timeline - 400) / 30) ** 2)), np.sin(timeline / 50)]
+    )
+    indices = lttbIndices(timeline, series, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+    assert series[indices, 0].max() == approx(1, abs=0.05)
+    assert series[indices, 1].min() == approx(-1, abs=0.05)
+
+
+def test_max_points_response(simulation_schema):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simulation = Simulation(**dict(simSIR, step=0.1, max_points=40))
+    result = Simulator(ModelContext(model)).simulate(simulation)
+    response = json.loads(serializers.serializeResult(result, simulation))
+    peaks = [frame[:, 1].max() for frame in result.frames]
+
+    assert len(result.timeline) == 500
+    for frame, peak in zip(response["frames"], peaks):
+        assert len(frame["columns"]) == 40
+        assert frame["columns"] == response["frames"][0]["columns"]
+        assert max(frame["data"][1]) == approx(peak, rel=0.02)
+
+    lines = serializers.streamResult(result, simulation)
+    streamed = [json.loads(line) for line in lines][1:]
+    assert all(len(frame["columns"]) == 40 for frame in streamed)
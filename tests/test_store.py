@@ -0,0 +1,49 @@
+import numpy as np
+from ecm.schemas import Model, Simulation
+from ecm.simulator import ModelContext, Simulator, computeExtraColumns
+from ecm.store import ResultStore, simulationHash
+from pytest import approx
+
+
+def test_store_roundtrip_time_range(simulation_schema, tmp_path):
+    model = Model(**simulation_schema("models/SIR.json"))
+    simSIR = {
+        "step": 1,
+        "days": 100,
+        "initial_conditions": {"S": 999600, "I": 400, "R": 0},
+        "params": {"beta": 0.3, "gamma": 0.0714},
+        "iterate": {"key": "beta", "intervals": 3, "start": 0.2, "end": 0.4},
+    }
+    context = ModelContext(model)
+    result = Simulator(context).simulate(Simulation(**simSIR))
+    computeExtraColumns(context, result)
+    store = ResultStore(tmp_path)
+    store.save(1, result)
+
+    loaded = store.load(1)
+    assert loaded.compartments == result.compartments
+    assert loaded.params == result.params
+    assert loaded.paramValues == approx(result.paramValues)
+    assert np.array_equal(np.stack(loaded.frames), np.stack(result.frames))
+
+    sliced = store.load(1, start=10, end=20.5)
+    assert sliced.timeline.tolist() == list(range(10, 21))
+    assert np.array_equal(sliced.frames[2], result.frames[2][10:21])
+
+
+def test_simulation_hash():
+    simulation = {
+        "initial_conditions": {"S": 999, "I": 1, "R": 0},
+        "params": {"gamma": 0.0714, "beta": 0.3},
+        "iterate": {
+            "sampler": "lhs",
+            "samples": 8,
+            "axes": [{"key": "beta", "start": 0.1, "end": 0.5}],
+        },
+    }
+    assert simulationHash(Simulation(**simulation)) is None
+
+    simulation["iterate"]["seed"] = 1
+    seeded = simulationHash(Simulation(**simulation))
+    simulation["params"] = {"beta": 0.3, "gamma": 0.0714}
+    assert simulationHash(Simulation(**simulation)) == seeded
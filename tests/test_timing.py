@@ -0,0 +1,32 @@
+import time
+from ecm.timing import Timings, currentTimings, stage, startTimings, stopTimings
+
+
+def test_nested_stages_count_their_own_time():
+    timings = Timings()
+    with timings.stage("outer"):
+        time.sleep(0.01)
+        with timings.stage("inner"):
+            time.sleep(0.02)
+    with timings.stage("outer"):
+        time.sleep(0.01)
+
+    assert list(timings.durations) == ["outer", "inner"]
+    # outer would be over 0.04 if it counted inner too
+    assert 0.02 <= timings.durations["outer"] < 0.04
+    assert timings.durations["inner"] >= 0.02
+    assert sum(timings.durations.values()) <= timings.total
+
+
+def test_stage_outside_timings():
+    with stage("solve"):
+        pass
+    assert currentTimings() is None
+
+    timings = startTimings()
+    with stage("solve"):
+        pass
+    stopTimings()
+    assert "solve" in timings.durations
+    assert currentTimings() is None
+    assert timings.serverTiming().startswith("solve;dur=")